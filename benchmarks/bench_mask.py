@@ -0,0 +1,123 @@
+"""
+Micro-benchmark for the DALL-E mask pipeline.
+
+Compares the original Image.eval + paste + separate resize path with
+imaging.process_mask_for_dalle on synthetic canvas masks, and checks the
+two produce byte-identical PNGs. Then compares the PNG data URL upload
+with the run-length mask generate.html sends: JSON payload size and
+decode time, drawn over the default seed photo like the real canvas.
+
+    python benchmarks/bench_mask.py --sizes 512 1024 2048 --repeat 50
+"""
+import argparse
+import base64
+import json
+import random
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+from imaging import (  # noqa: E402
+    DALLE_SIZE, encode_mask_rle, process_mask_for_dalle)
+
+SEED_IMAGE = (Path(__file__).resolve().parent.parent
+              / 'src' / 'static' / 'data' / 'seed_image.jpg')
+
+
+def legacy_process_mask(mask_data_url):
+    """The pre-optimization implementation, kept for comparison."""
+    header, encoded = mask_data_url.split(",", 1)
+    mask_data = base64.b64decode(encoded)
+    mask_image = Image.open(BytesIO(mask_data)).convert("RGBA")
+    alpha = mask_image.split()[3]
+    final_mask = Image.new('RGBA', mask_image.size, (0, 0, 0, 255))
+    transparent_areas = Image.new('RGBA', mask_image.size, (0, 0, 0, 0))
+    final_mask.paste(transparent_areas, mask=Image.eval(
+        alpha, lambda x: 255 if x == 0 else 0))
+    return final_mask.resize(DALLE_SIZE)
+
+
+def make_mask_canvas(size, strokes=40, seed=0, background=None):
+    """Draw erased brush strokes over an opaque canvas, like generate.html."""
+    rng = random.Random(seed)
+    if background:
+        canvas = Image.open(background).convert('RGBA').resize((size, size))
+    else:
+        canvas = Image.new('RGBA', (size, size), (120, 160, 200, 255))
+    draw = ImageDraw.Draw(canvas)
+    for _ in range(strokes):
+        x, y = rng.randrange(size), rng.randrange(size)
+        draw.line([(x, y), (x + rng.randrange(-200, 200),
+                            y + rng.randrange(-200, 200))],
+                  fill=(0, 0, 0, 0), width=max(size // 20, 1))
+    return canvas
+
+
+def make_mask_data_url(size, strokes=40, seed=0, background=None):
+    canvas = make_mask_canvas(size, strokes, seed, background)
+    buffer = BytesIO()
+    canvas.save(buffer, format='PNG')
+    return 'data:image/png;base64,' + base64.b64encode(buffer.getvalue()).decode()
+
+
+def png_bytes(image):
+    buffer = BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def time_it(fn, arg, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(arg)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[512, 1024, 2048])
+    parser.add_argument('--repeat', type=int, default=30)
+    args = parser.parse_args()
+
+    print(f"{'canvas':>10} {'legacy ms':>10} {'new ms':>10} {'speedup':>8} identical")
+    for size in args.sizes:
+        data_url = make_mask_data_url(size)
+        identical = (png_bytes(legacy_process_mask(data_url))
+                     == png_bytes(process_mask_for_dalle(data_url)))
+        legacy_ms = time_it(legacy_process_mask, data_url, args.repeat)
+        new_ms = time_it(process_mask_for_dalle, data_url, args.repeat)
+        print(f"{size:>5}x{size:<4} {legacy_ms:>10.2f} {new_ms:>10.2f} "
+              f"{legacy_ms / new_ms:>7.2f}x {identical}")
+        if not identical:
+            sys.exit(f"Output mismatch at {size}x{size}")
+
+    background = SEED_IMAGE if SEED_IMAGE.exists() else None
+    print(f"\n{'canvas':>10} {'PNG KB':>8} {'RLE KB':>8} {'smaller':>8} "
+          f"{'PNG ms':>8} {'RLE ms':>8} {'speedup':>8} identical")
+    for size in args.sizes:
+        canvas = make_mask_canvas(size, background=background)
+        buffer = BytesIO()
+        canvas.save(buffer, format='PNG')
+        data_url = ('data:image/png;base64,'
+                    + base64.b64encode(buffer.getvalue()).decode())
+        rle = encode_mask_rle(canvas)
+        png_kb = len(json.dumps({'mask': data_url})) / 1024
+        rle_kb = len(json.dumps({'mask': rle})) / 1024
+        identical = (png_bytes(process_mask_for_dalle(data_url))
+                     == png_bytes(process_mask_for_dalle(rle)))
+        png_ms = time_it(process_mask_for_dalle, data_url, args.repeat)
+        rle_ms = time_it(process_mask_for_dalle, rle, args.repeat)
+        print(f"{size:>5}x{size:<4} {png_kb:>8.1f} {rle_kb:>8.1f} "
+              f"{png_kb / rle_kb:>7.1f}x {png_ms:>8.2f} {rle_ms:>8.2f} "
+              f"{png_ms / rle_ms:>7.2f}x {identical}")
+        if not identical:
+            sys.exit(f"RLE output mismatch at {size}x{size}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Startup benchmark: time to import app.py, build the Flask app and serve
+the first requests, each run in a fresh interpreter like a new gunicorn
+worker. Runs against local storage with dummy credentials, so routes
+that need MySQL or OpenAI are left out.
+
+    python benchmarks/bench_startup.py --runs 10
+
+To compare with an older revision, point --src at a checkout of it:
+
+    git worktree add /tmp/before <commit>
+    python benchmarks/bench_startup.py --src /tmp/before/src
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+
+# runs in the child interpreter; prints one JSON line of timings in ms
+CHILD = r'''
+import importlib, json, sys, time
+routes = json.loads(sys.argv[1])
+timings = {}
+start = time.perf_counter()
+module = importlib.import_module('app')
+timings['import'] = (time.perf_counter() - start) * 1000
+
+start = time.perf_counter()
+factory = getattr(module, 'create_app', None)
+application = factory() if factory else module.app
+timings['create_app'] = (time.perf_counter() - start) * 1000
+
+client = application.test_client()
+for label, route in routes:
+    for attempt in ('first', 'second'):
+        start = time.perf_counter()
+        response = client.get(route)
+        response.get_data()
+        timings[f'{attempt} {label}'] = (time.perf_counter() - start) * 1000
+        if response.status_code >= 400:
+            sys.exit(f"{route} returned {response.status_code}")
+
+# what the first generation pays if the SDK wasn't imported at startup
+start = time.perf_counter()
+import openai  # noqa: F401
+timings['openai import (deferred)'] = (time.perf_counter() - start) * 1000
+print(json.dumps(timings))
+'''
+
+
+def child_env(storage_dir):
+    env = dict(os.environ)
+    env.update({
+        'AWS_ACCESS_KEY_ID': 'bench',
+        'AWS_SECRET_ACCESS_KEY': 'bench',
+        'OPENAI_API_KEY': 'bench',
+        # nothing listens here; routes measured don't query MySQL
+        'RDS_HOST': '127.0.0.1',
+        'RDS_PORT': '1',
+        'RDS_DATABASE': 'bench',
+        'RDS_USERNAME': 'bench',
+        'RDS_PASSWORD': 'bench',
+        'STORAGE_BACKEND': 'local',
+        'LOCAL_STORAGE_DIR': storage_dir,
+        'DB_POOL_STATS_INTERVAL': '0',
+        'ADMISSION_STATE_PATH': os.path.join(storage_dir, 'admission.sqlite3'),
+    })
+    return env
+
+
+def make_proxy_object(storage_dir):
+    """An object for /proxy-image, with the repo's default bucket name."""
+    key = 'daily-submissions/bench.png'
+    path = Path(storage_dir) / 'pixelspatchwork' / key
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes((BENCH_DIR.parent / 'src' / 'static' / 'data'
+                      / 'img-icon.png').read_bytes())
+    return f"/proxy-image?url=https://pixelspatchwork.s3.amazonaws.com/{key}"
+
+
+def run_once(src, routes, env):
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD, json.dumps(routes)],
+        cwd=src, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(f"Startup run failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--src', default=str(BENCH_DIR.parent / 'src'),
+                        help='directory containing app.py')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--output', help='also write the medians as JSON')
+    args = parser.parse_args()
+
+    storage_dir = tempfile.mkdtemp(prefix='pixelspatchwork-startup-')
+    routes = [('/', '/'), ('/metrics', '/metrics'),
+              ('/proxy-image', make_proxy_object(storage_dir))]
+    env = child_env(storage_dir)
+
+    runs = [run_once(args.src, routes, env) for _ in range(args.runs)]
+    medians = {name: statistics.median(run[name] for run in runs)
+               for name in runs[0]}
+
+    print(f"{args.src} (median of {args.runs} runs)")
+    for name, ms in medians.items():
+        print(f"  {name:<28} {ms:>9.1f} ms")
+    print(f"  {'ready to serve':<28} "
+          f"{medians['import'] + medians['create_app']:>9.1f} ms")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(medians, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Compare two benchmarks/loadtest.py reports, e.g. before and after a change.
+
+    python benchmarks/compare.py before.json after.json
+"""
+import argparse
+import json
+
+METRICS = ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms',
+           'db_queries_per_request')
+
+
+def change(old, new):
+    if old in (None, 0) or new is None:
+        return ''
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print(f"{before.get('commit')} -> {after.get('commit')}")
+
+    for endpoint, levels in after['results'].items():
+        for concurrency, new in levels.items():
+            old = before['results'].get(endpoint, {}).get(concurrency)
+            if old is None:
+                continue
+            print(f"\n{endpoint} (concurrency {concurrency})")
+            for metric in METRICS:
+                print(f"  {metric:<24} {old.get(metric)!s:>10} -> "
+                      f"{new.get(metric)!s:>10}  {change(old.get(metric), new.get(metric))}")
+            if new.get('errors') or old.get('errors'):
+                print(f"  {'errors':<24} {old.get('errors')!s:>10} -> {new.get('errors')!s:>10}")
+
+
+if __name__ == '__main__':
+    main()
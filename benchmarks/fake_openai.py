@@ -0,0 +1,114 @@
+"""
+Local stand-in for the OpenAI images API, for offline runs and load tests.
+
+Implements POST /v1/images/edits (url and b64_json response formats)
+and serves the "generated" PNGs it returns by URL. Point the app at it with OPENAI_BASE_URL and any OPENAI_API_KEY:
+
+    python benchmarks/fake_openai.py --port 8001 --latency 2.0
+    OPENAI_BASE_URL=http://localhost:8001/v1/ OPENAI_API_KEY=fake python src/app.py
+"""
+import argparse
+import base64
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+from PIL import Image
+
+
+def make_png(size=512):
+    """Solid-colour PNG standing in for a DALL-E result."""
+    color = tuple(random.randrange(256) for _ in range(3)) + (255,)
+    buffer = BytesIO()
+    Image.new('RGBA', (size, size), color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, jitter=0.0, error_rate=0.0):
+        super().__init__(address, FakeOpenAIHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.images = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1/"
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type='application/json'):
+        if isinstance(body, dict):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not self.path.rstrip('/').endswith('/images/edits'):
+            return self._send(404, {'error': {'message': 'Not found'}})
+
+        with server.lock:
+            server.requests += 1
+        time.sleep(max(0.0, server.latency
+                       + random.uniform(-server.jitter, server.jitter)))
+        if random.random() < server.error_rate:
+            return self._send(500, {'error': {'message': 'Injected failure',
+                                              'type': 'server_error'}})
+
+        # multipart form field sent by the SDK for response_format
+        if b'name="response_format"\r\n\r\nb64_json' in body:
+            image = {'b64_json': base64.b64encode(make_png()).decode()}
+        else:
+            image_id = uuid.uuid4().hex
+            with server.lock:
+                server.images[image_id] = make_png()
+            host, port = server.server_address[:2]
+            image = {'url': f"http://{host}:{port}/files/{image_id}.png"}
+        self._send(200, {'created': int(time.time()), 'data': [image]})
+
+    def do_GET(self):
+        image_id = self.path.rsplit('/', 1)[-1].split('.')[0]
+        with self.server.lock:
+            image = self.server.images.pop(image_id, None)
+        if image is None:
+            return self._send(404, {'error': {'message': 'Not found'}})
+        self._send(200, image, content_type='image/png')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=1.0,
+                        help='seconds each edit request takes')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer((args.host, args.port), args.latency,
+                              args.jitter, args.error_rate)
+    print(f"Fake OpenAI images API at {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
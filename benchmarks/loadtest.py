@@ -0,0 +1,379 @@
+"""
+Offline load test for the Flask app.
+
+Runs app.py under gunicorn against local stand-ins only: a MySQL
+database you point it at (never production), filesystem (or moto) S3
+and benchmarks/fake_openai.py. It seeds synthetic users, days and
+images, then drives each endpoint at the given concurrency levels and
+prints JSON with throughput, latency percentiles and MySQL queries per
+request. Compare two runs with benchmarks/compare.py.
+
+    docker run -d --name bench-mysql -p 3306:3306 \\
+        -e MYSQL_ROOT_PASSWORD=bench -e MYSQL_DATABASE=pixelspatchwork_bench mysql:8.0
+    python benchmarks/loadtest.py --seed --days 30 --images-per-day 2000 \\
+        --concurrency 1 8 32 --duration 10 --output before.json
+
+Query counts come from MySQL's global 'Questions' counter, so nothing
+else should use the database during a run.
+"""
+import argparse
+import json
+import os
+import random
+import shlex
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import requests
+
+BENCH_DIR = Path(__file__).resolve().parent
+SRC_DIR = BENCH_DIR.parent / 'src'
+sys.path.insert(0, str(SRC_DIR))
+
+from bench_mask import make_mask_canvas  # noqa: E402
+from fake_openai import FakeOpenAIServer, make_png  # noqa: E402
+from imaging import encode_mask_rle  # noqa: E402
+
+ENDPOINTS = ('generate-image', 'vote-image', 'votes', 'get-images',
+             'get-history', 'leaderboard', 'proxy-image')
+# objects written to storage for /proxy-image; the rest only exist as rows
+PROXY_OBJECTS = 200
+
+
+def configure_env(args, storage_dir, openai_url):
+    """Settings for both the app process and the seeding code in here."""
+    env = {
+        'RDS_HOST': args.db_host,
+        'RDS_PORT': str(args.db_port),
+        'RDS_DATABASE': args.db_name,
+        'RDS_USERNAME': args.db_user,
+        'RDS_PASSWORD': args.db_password,
+        'OPENAI_API_KEY': 'fake',
+        'OPENAI_BASE_URL': openai_url,
+        'AWS_ACCESS_KEY_ID': 'bench',
+        'AWS_SECRET_ACCESS_KEY': 'bench',
+        'STORAGE_BACKEND': 's3' if args.s3_endpoint_url else 'local',
+        'S3_ENDPOINT_URL': args.s3_endpoint_url or '',
+        'LOCAL_STORAGE_DIR': storage_dir,
+        'DB_POOL_STATS_INTERVAL': '0',
+        # every simulated client shares one address; measure the app,
+        # not the limiter
+        'GENERATION_RATE_PER_MINUTE': '0',
+        'GENERATION_MAX_IN_FLIGHT': '0',
+        'ADMISSION_STATE_PATH': os.path.join(storage_dir, 'admission.sqlite3'),
+    }
+    os.environ.update(env)
+    return env
+
+
+def seed(days, images_per_day, users=1000):
+    """Create the schema and fill it with synthetic rows and objects."""
+    import migrate
+    from config import S3_BUCKET
+    from storage import s3_client
+
+    db_conn = migrate.connect()
+    migrate.upgrade(db_conn)
+    cursor = db_conn.cursor()
+    cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+    for table in ('DayParticipant', 'Image', 'Day', 'User'):
+        cursor.execute(f"TRUNCATE TABLE {table}")
+    cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+
+    rng = random.Random(0)
+    now = datetime.now().replace(microsecond=0)
+    user_ids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(users)]
+    cursor.executemany(
+        "INSERT INTO User (user_id, username, created_at, is_banned) VALUES (%s, 'Unknown', %s, FALSE)",
+        [(user_id, now) for user_id in user_ids])
+
+    today = date.today()
+    proxy_paths = []
+    for offset in range(days):
+        day = today - timedelta(days=offset)
+        cursor.execute(
+            "INSERT INTO Day (date, total_votes, total_participants, is_current) VALUES (%s, 0, 0, %s)",
+            (day, offset == 0))
+        rows = []
+        for _ in range(images_per_day):
+            image_id = str(uuid.UUID(int=rng.getrandbits(128)))
+            s3_path = f"daily-submissions/{day}/{image_id}.png"
+            created_at = datetime.combine(day, datetime.min.time()) + timedelta(
+                seconds=rng.randrange(86400))
+            rows.append((image_id, s3_path, 'synthetic prompt', created_at,
+                         rng.choice(user_ids), day, rng.randrange(50),
+                         rng.randrange(20)))
+            if len(proxy_paths) < PROXY_OBJECTS:
+                proxy_paths.append(s3_path)
+        for i in range(0, len(rows), 1000):
+            cursor.executemany("""
+                INSERT INTO Image (image_id, s3_path, prompt_text, created_at,
+                                   creator_id, day, upvotes, downvotes, flags)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 0)
+            """, rows[i:i + 1000])
+        # distinct creators, as recording each image would have counted
+        cursor.execute("""
+            INSERT INTO DayParticipant (day, user_id)
+            SELECT DISTINCT day, creator_id FROM Image WHERE day = %s
+        """, (day,))
+        cursor.execute("UPDATE Day SET total_participants = %s WHERE date = %s",
+                       (cursor.rowcount, day))
+        if rows and offset > 0:
+            winner = min(rows, key=lambda row: (-row[6], row[7], row[3]))
+            cursor.execute("UPDATE Day SET seed_image_id = %s WHERE date = %s",
+                           (winner[0], day))
+        db_conn.commit()
+        print(f"seeded {day}: {len(rows)} images", file=sys.stderr)
+
+    png = make_png()
+    for s3_path in proxy_paths:
+        s3_client.put_object(Bucket=S3_BUCKET, Key=s3_path, Body=png,
+                             ContentType='image/png')
+    cursor.close()
+    db_conn.close()
+
+
+def sample_targets():
+    """Image ids and stored paths the request generators pick from."""
+    import migrate
+    db_conn = migrate.connect()
+    cursor = db_conn.cursor()
+    cursor.execute("SELECT image_id FROM Image WHERE day = %s LIMIT 5000",
+                   (date.today(),))
+    today_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT s3_path FROM Image ORDER BY day DESC, image_id LIMIT %s",
+        (PROXY_OBJECTS,))
+    paths = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    db_conn.close()
+    if not today_ids:
+        raise SystemExit('No images for today; run with --seed first')
+    return today_ids, paths
+
+
+def query_count(db_conn):
+    cursor = db_conn.cursor()
+    cursor.execute("SHOW GLOBAL STATUS LIKE 'Questions'")
+    count = int(cursor.fetchone()[1])
+    cursor.close()
+    return count
+
+
+def request_factory(endpoint, base_url, today_ids, paths, mask):
+    """Return a function making one request of the endpoint on a session."""
+    created_at = datetime.now().strftime("%m/%d/%Y, %I:%M:%S %p")
+
+    def call(session):
+        if endpoint == 'generate-image':
+            return session.post(f"{base_url}/generate-image", json={
+                'prompt': 'a synthetic prompt',
+                'mask': mask,
+                'seedImage': f"{base_url}/static/data/seed_image.jpg",
+                'createdAt': created_at,
+                'idempotencyKey': uuid.uuid4().hex,
+            })
+        if endpoint == 'vote-image':
+            return session.post(f"{base_url}/vote-image", json={
+                'image_id': random.choice(today_ids),
+                'current_vote': 0, 'new_vote': random.choice((1, -1))})
+        if endpoint == 'votes':
+            return session.post(f"{base_url}/votes", json={'votes': [
+                {'image_id': image_id, 'current_vote': 0, 'new_vote': 1}
+                for image_id in random.sample(today_ids, min(10, len(today_ids)))]})
+        if endpoint == 'get-images':
+            return session.get(f"{base_url}/get-images",
+                               params={'day': created_at})
+        if endpoint == 'get-history':
+            return session.get(f"{base_url}/get-history")
+        if endpoint == 'leaderboard':
+            return session.get(f"{base_url}/leaderboard")
+        if endpoint == 'proxy-image':
+            return session.get(f"{base_url}/proxy-image", params={
+                'url': f"https://pixelspatchwork.s3.amazonaws.com/{random.choice(paths)}"})
+        raise ValueError(endpoint)
+    return call
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def drive(call, concurrency, duration):
+    """Run call() from `concurrency` threads for `duration` seconds."""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        nonlocal errors
+        session = requests.Session()
+        local_latencies, local_errors = [], 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = call(session)
+                ok = response.status_code < 400
+                response.content
+            except requests.RequestException:
+                ok = False
+            local_latencies.append((time.perf_counter() - start) * 1000)
+            local_errors += not ok
+        with lock:
+            latencies.extend(local_latencies)
+            errors += local_errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 50), 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95), 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99), 2) if latencies else None,
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_app(args, env):
+    port = free_port()
+    command = shlex.split(args.server_cmd.format(port=port))
+    process = subprocess.Popen(
+        command, cwd=SRC_DIR, env=dict(os.environ, **env),
+        stdout=subprocess.DEVNULL, stderr=None if args.verbose else subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        if process.poll() is not None:
+            raise SystemExit(f"App exited with {process.returncode}")
+        try:
+            requests.get(f"{base_url}/", timeout=1)
+            return process, base_url
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit('App did not start')
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR,
+            text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--db-host', default='127.0.0.1')
+    parser.add_argument('--db-port', type=int, default=3306)
+    parser.add_argument('--db-name', default='pixelspatchwork_bench')
+    parser.add_argument('--db-user', default='root')
+    parser.add_argument('--db-password', default='bench')
+    parser.add_argument('--s3-endpoint-url',
+                        help='e.g. http://127.0.0.1:5000 for moto_server; '
+                             'default is filesystem storage')
+    parser.add_argument('--seed', action='store_true',
+                        help='recreate the synthetic data set first')
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--images-per-day', type=int, default=2000)
+    parser.add_argument('--endpoints', nargs='+', default=list(ENDPOINTS),
+                        choices=ENDPOINTS)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--duration', type=float, default=10,
+                        help='seconds per endpoint and concurrency level')
+    parser.add_argument('--openai-latency', type=float, default=2.0)
+    parser.add_argument('--server-cmd',
+                        default='gunicorn --workers 1 --threads 32 '
+                                "--bind 127.0.0.1:{port} 'app:create_app()'")
+    parser.add_argument('--output', help='write JSON here instead of stdout')
+    parser.add_argument('--verbose', action='store_true',
+                        help='show app logs')
+    args = parser.parse_args()
+
+    if args.db_host not in ('127.0.0.1', 'localhost') and not args.db_name.endswith('_bench'):
+        raise SystemExit('Refusing to load test a non-local, non-_bench database')
+
+    openai_server = FakeOpenAIServer(('127.0.0.1', 0), args.openai_latency)
+    threading.Thread(target=openai_server.serve_forever, daemon=True).start()
+    storage_dir = os.environ.get('BENCH_STORAGE_DIR') or tempfile.mkdtemp(
+        prefix='pixelspatchwork-bench-')
+    env = configure_env(args, storage_dir, openai_server.base_url)
+
+    if args.seed:
+        seed(args.days, args.images_per_day)
+    today_ids, paths = sample_targets()
+    # the run-length mask generate.html sends
+    mask = encode_mask_rle(make_mask_canvas(512))
+
+    import migrate
+    counter_conn = migrate.connect()
+    process, base_url = start_app(args, env)
+    results = {}
+    try:
+        for endpoint in args.endpoints:
+            call = request_factory(endpoint, base_url, today_ids, paths, mask)
+            for concurrency in args.concurrency:
+                before = query_count(counter_conn)
+                result = drive(call, concurrency, args.duration)
+                if endpoint in ('vote-image', 'votes'):
+                    # let the write-behind buffer flush what was queued
+                    time.sleep(float(os.environ.get('VOTE_FLUSH_INTERVAL', 2)) + 1)
+                # minus the SHOW STATUS that read `before`
+                queries = query_count(counter_conn) - before - 1
+                result['db_queries_per_request'] = (
+                    round(queries / result['requests'], 3)
+                    if result['requests'] else None)
+                results.setdefault(endpoint, {})[str(concurrency)] = result
+                print(f"{endpoint} c={concurrency}: {result}", file=sys.stderr)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+        counter_conn.close()
+        openai_server.shutdown()
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'config': {
+            'days': args.days,
+            'images_per_day': args.images_per_day,
+            'duration': args.duration,
+            'openai_latency': args.openai_latency,
+            'server_cmd': args.server_cmd,
+            'storage': 's3' if args.s3_endpoint_url else 'local',
+        },
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
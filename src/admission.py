@@ -0,0 +1,167 @@
+import logging
+import math
+import sqlite3
+import time
+import uuid
+
+from metrics import registry
+from statefile import StateFile
+
+admissions = registry.counter(
+    'pixelspatchwork_generation_admissions_total',
+    'Generation requests by admission result',
+    ('result',))
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS buckets (
+        bucket_key TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        updated_at REAL NOT NULL)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS slots (
+        slot_id TEXT PRIMARY KEY,
+        bucket_key TEXT NOT NULL,
+        expires_at REAL NOT NULL)
+    """,
+)
+
+
+class Rejected(Exception):
+    """Raised when a generation is not admitted; carries Retry-After."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Admission:
+    """
+    Admission control for image generation, shared by every worker on
+    the host through a SQLite file.
+    - Each creator has a token bucket of `burst` generations refilled at
+      `rate` per second (0 disables it); a generation takes one token
+    - At most `max_in_flight` generations run at once across workers
+      (0 disables the cap); slots are leases that expire after
+      `slot_ttl` seconds, so a killed worker can't leak them
+    - If the state file can't be used, requests are admitted rather
+      than failing generation outright
+    """
+
+    def __init__(self, path, rate, burst, max_in_flight, slot_ttl,
+                 retry_after, busy_timeout=1.0):
+        self.path = path
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.slot_ttl = slot_ttl
+        self.retry_after = retry_after
+        self._state = StateFile(path, SCHEMA, busy_timeout)
+        self._last_prune = 0
+        self._errors = 0
+
+    def admit(self, key):
+        """
+        Take a token from key's bucket and an in-flight slot. Returns the
+        slot id to pass to release(); raises Rejected if either is
+        exhausted.
+        """
+        now = time.time()
+        try:
+            conn = self._state.connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM slots WHERE expires_at < ?", (now,))
+                if self.max_in_flight:
+                    in_flight, = conn.execute(
+                        "SELECT COUNT(*) FROM slots").fetchone()
+                    if in_flight >= self.max_in_flight:
+                        raise Rejected('over_capacity', self.retry_after)
+
+                if self.rate > 0:
+                    row = conn.execute(
+                        "SELECT tokens, updated_at FROM buckets WHERE bucket_key = ?",
+                        (key,)).fetchone()
+                    tokens = self.burst if row is None else min(
+                        self.burst, row[0] + (now - row[1]) * self.rate)
+                    if tokens < 1:
+                        raise Rejected(
+                            'rate_limited', math.ceil((1 - tokens) / self.rate))
+
+                    conn.execute("""
+                        INSERT INTO buckets (bucket_key, tokens, updated_at)
+                        VALUES (?, ?, ?)
+                        ON CONFLICT (bucket_key)
+                        DO UPDATE SET tokens = excluded.tokens,
+                                      updated_at = excluded.updated_at
+                    """, (key, tokens - 1, now))
+                slot_id = uuid.uuid4().hex
+                conn.execute(
+                    "INSERT INTO slots (slot_id, bucket_key, expires_at) "
+                    "VALUES (?, ?, ?)",
+                    (slot_id, key, now + self.slot_ttl))
+                self._prune(conn, now)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except Rejected as e:
+            admissions.inc(result=e.reason)
+            raise
+        except sqlite3.Error as e:
+            logging.error(f"Admission state unavailable, admitting: {e}")
+            self._errors += 1
+            admissions.inc(result='admitted')
+            return None
+
+        admissions.inc(result='admitted')
+        return slot_id
+
+    def _prune(self, conn, now):
+        """Drop buckets that have refilled completely (transaction held)."""
+        if self.rate <= 0 or now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        conn.execute("DELETE FROM buckets WHERE updated_at < ?",
+                     (now - self.burst / self.rate,))
+
+    def release(self, slot_id, refund=False):
+        """
+        Free an in-flight slot; with refund, also give the token back
+        (for admitted requests that were never run).
+        """
+        if slot_id is None:
+            return
+        try:
+            conn = self._state.connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT bucket_key FROM slots WHERE slot_id = ?",
+                    (slot_id,)).fetchone()
+                conn.execute("DELETE FROM slots WHERE slot_id = ?", (slot_id,))
+                if refund and row:
+                    conn.execute("""
+                        UPDATE buckets SET tokens = MIN(tokens + 1, ?)
+                        WHERE bucket_key = ?
+                    """, (self.burst, row[0]))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            # the lease expires on its own after slot_ttl
+            logging.error(f"Error releasing admission slot {slot_id}: {e}")
+
+    def stats(self):
+        stats = {'errors': self._errors}
+        try:
+            stats['in_flight'], = self._state.connection().execute(
+                "SELECT COUNT(*) FROM slots WHERE expires_at >= ?",
+                (time.time(),)).fetchone()
+        except sqlite3.Error:
+            pass
+        stats['max_in_flight'] = self.max_in_flight
+        return stats
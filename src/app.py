@@ -1,299 +1,739 @@
 import logging
 from flask_cors import CORS
-from flask import request, jsonify, Flask, render_template, url_for, Response
+from flask import (
+    request, jsonify, Blueprint, Flask, render_template, url_for, Response, g)
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
 import sys
+import threading
 import os
+import time
 import uuid
+import base64
 from config import *
 from datetime import datetime
-import mysql.connector
-import boto3
+from zoneinfo import ZoneInfo
 import requests
-import openai
-import base64
+from requests.adapters import HTTPAdapter
+from urllib.parse import parse_qs, unquote, urlsplit
+from urllib3.util.retry import Retry
+from mysql.connector import errorcode, IntegrityError
 from io import BytesIO
-from PIL import Image
+from admission import Admission, Rejected
+from cache import LRUByteCache, LRUTTLCache, TTLCache
+from db import db_pool
+from delivery import PresignedUrls
+from events import TooManySubscribers, VoteEvents
+from imaging import (
+    DALLE_SIZE, derivative_key, is_mask_rle, prepare_seed_png,
+    process_mask_for_dalle)
+from jobs import JobRunner, QueueFull
+from leaderboard import Leaderboards
+from metrics import registry, span, stage_seconds
+from participants import Participants
+from storage import s3_client
+from submissions import (
+    delete_submission_objects, submission_image_id, upload_submission)
+from thumbnails import upload_derivatives
+from votes import VoteBuffer, vote_deltas
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
 logging.basicConfig(level=logging.INFO)
 
-app = Flask(__name__)
-CORS(app)
-bucket_name = 'pixelspatchwork'
+# routes are registered on the app built by create_app()
+bp = Blueprint('pixelspatchwork', __name__)
+
+bucket_name = S3_BUCKET
+
+# images under this prefix are written once and can be cached forever
+IMMUTABLE_IMAGE_PREFIX = 'daily-submissions/'
+proxy_cache = LRUByteCache(PROXY_CACHE_MAX_BYTES, PROXY_CACHE_MAX_ITEM_BYTES)
+# thumbnail key -> whether it exists, so /proxy-image doesn't HEAD it
+# on every request
+derivative_lookups = LRUTTLCache(THUMBNAIL_LOOKUP_TTL)
+# seed image s3_path (or None for the default seed) keyed by date
+seed_image_cache = TTLCache(SEED_CACHE_TTL)
+# ready-to-send seed PNGs keyed by S3 path or DEFAULT_SEED_KEY
+DEFAULT_SEED_KEY = 'static/data/seed_image.jpg'
+DEFAULT_SEED_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), DEFAULT_SEED_KEY)
+seed_png_cache = LRUByteCache(SEED_PNG_CACHE_MAX_BYTES)
+# per-day image rankings, updated incrementally as votes are flushed
+leaderboards = Leaderboards(
+    db_pool.get_connection, LEADERBOARD_TTL, LEADERBOARD_MAX_DAYS)
+# distinct creators per day, for /increment-participant
+participants = Participants(db_pool.get_connection, PARTICIPANT_CACHE_DAYS)
+# job status shared through the admission state file, so any worker
+# can answer a poll
+generation_jobs = JobRunner(
+    ADMISSION_STATE_PATH, GENERATION_WORKERS, GENERATION_QUEUE_DEPTH,
+    GENERATION_RESULT_TTL, GENERATION_SLOT_TTL)
+# per-creator rate limit and global in-flight cap for generations
+admission = Admission(
+    ADMISSION_STATE_PATH, GENERATION_RATE_PER_MINUTE / 60,
+    GENERATION_RATE_BURST, GENERATION_MAX_IN_FLIGHT, GENERATION_SLOT_TTL,
+    GENERATION_RETRY_AFTER)
+# presigned S3 URLs for pages, or None to serve images via /proxy-image
+presigned_urls = None
+if IMAGE_DELIVERY == 'presigned':
+    if STORAGE_BACKEND == 'local':
+        logging.warning("Presigned delivery needs S3, using /proxy-image")
+    else:
+        presigned_urls = PresignedUrls(
+            s3_client, bucket_name, PRESIGNED_URL_EXPIRES,
+            PRESIGNED_URL_REFRESH_MARGIN)
+
+# built on the first generation; the SDK takes ~0.5s to import and most
+# workers mostly serve votes and images
+_openai_client = None
+_openai_client_lock = threading.Lock()
+
+
+def get_openai_client():
+    """OpenAI client shared by every generation in this worker."""
+    global _openai_client
+    with _openai_client_lock:
+        if _openai_client is None:
+            import openai
+            # OPENAI_BASE_URL: e.g. benchmarks/fake_openai.py for offline runs
+            _openai_client = openai.OpenAI(
+                api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
+    return _openai_client
+
+
+def _is_openai_error(error):
+    # no OpenAI error can exist before the SDK has been imported
+    openai = sys.modules.get('openai')
+    return openai is not None and isinstance(error, openai.OpenAIError)
+
+
+def create_download_session():
+    """Pooled session with retries for downloading generated images."""
+    session = requests.Session()
+    retries = Retry(
+        total=IMAGE_DOWNLOAD_MAX_RETRIES,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=('GET',))
+    adapter = HTTPAdapter(pool_maxsize=GENERATION_WORKERS, max_retries=retries)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+download_session = create_download_session()
+
+http_request_seconds = registry.histogram(
+    'pixelspatchwork_http_request_seconds',
+    'Time to produce a response, by route, method and status',
+    ('route', 'method', 'status'))
+http_requests_in_flight = registry.gauge(
+    'pixelspatchwork_http_requests_in_flight',
+    'Requests being handled, by route', ('route',))
+
+
+@bp.before_app_request
+def _start_request_timer():
+    g.request_route = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.request_start = time.perf_counter()
+    http_requests_in_flight.inc(route=g.request_route)
+
+
+def _finish_request(status):
+    if 'request_start' not in g:
+        return
+    http_requests_in_flight.dec(route=g.request_route)
+    http_request_seconds.observe(
+        time.perf_counter() - g.pop('request_start'),
+        route=g.request_route, method=request.method, status=status)
+
+
+@bp.after_app_request
+def _record_request(response):
+    _finish_request(response.status_code)
+    return response
+
+
+@bp.teardown_app_request
+def _record_failed_request(error):
+    # only still pending if the view raised past after_request
+    _finish_request(500)
+
 
 ### routes for pages ###
 
 
-@app.route('/')
+@bp.route('/')
 def test():
-    return render_template('index.html')
+    return render_template('index.html', day_timezone=DAY_TIMEZONE)
 
 
-@app.route('/generate')
+@bp.route('/generate')
 def generate():
     # get the seed image URL based on the day
     seed_image_url = get_seed_image()
     return render_template(
         'pages/generate.html',
-        seed_image_url=seed_image_url)
+        seed_image_url=seed_image_url,
+        day_timezone=DAY_TIMEZONE)
 
 
-@app.route('/vote')
+@bp.route('/vote')
 def vote():
-    return render_template('pages/vote.html')
+    return render_template(
+        'pages/vote.html',
+        vote_stream_enabled=VOTE_STREAM_MAX_CLIENTS > 0,
+        vote_poll_interval=VOTE_POLL_INTERVAL,
+        vote_counts_max_ids=GET_IMAGES_MAX_PAGE_SIZE,
+        day_timezone=DAY_TIMEZONE)
 
 
-@app.route('/goodbye')
+@bp.route('/goodbye')
 def goodbye():
-    return render_template('pages/goodbye.html')
+    return render_template('pages/goodbye.html', day_timezone=DAY_TIMEZONE)
 
 
 ### helper functions ###
 
+def today():
+    """Current date in DAY_TIMEZONE, where days start and end."""
+    return datetime.now(ZoneInfo(DAY_TIMEZONE)).date()
+
+
 def get_db_connection():
-    """Create a connection to the RDS database"""
-    return mysql.connector.connect(
-        host=RDS_HOST,
-        port=RDS_PORT,
-        database=RDS_DATABASE,
-        user=RDS_USERNAME,
-        password=RDS_PASSWORD
-    )
+    """Check out a pooled connection to the RDS database (close() returns it)"""
+    return db_pool.get_connection()
+
+
+def proxy_url(s3_path, size=None):
+    """Relative /proxy-image URL for an object, optionally a thumbnail."""
+    url = f"/proxy-image?url=https://{bucket_name}.s3.amazonaws.com/{s3_path}"
+    return f"{url}&size={size}" if size else url
+
+
+def image_urls(s3_paths, size=None):
+    """
+    Map S3 paths to the URLs pages should load them from: presigned S3
+    URLs when IMAGE_DELIVERY is 'presigned', proxy URLs otherwise.
+    `size` must be one of THUMBNAIL_SIZES; pages fall back to the proxy
+    (which serves the original) if that derivative does not exist.
+    """
+    if presigned_urls is None:
+        return {s3_path: proxy_url(s3_path, size) for s3_path in s3_paths}
+    keys = {s3_path: derivative_key(s3_path, size) if size else s3_path
+            for s3_path in s3_paths}
+    signed = presigned_urls.get_many(list(keys.values()))
+    return {s3_path: signed[key] for s3_path, key in keys.items()}
+
+
+def _thumbnail_size(value):
+    """Return value as a configured thumbnail size, or None."""
+    if value and value.isdigit() and int(value) in THUMBNAIL_SIZES:
+        return int(value)
+    return None
+
+
+def _s3_path_from_url(url):
+    """S3 key from a proxy, S3 or presigned S3 URL."""
+    parts = urlsplit(url)
+    if parts.path.endswith('/proxy-image'):
+        inner = parse_qs(parts.query).get('url')
+        if inner:
+            return _s3_path_from_url(inner[0])
+    path = unquote(parts.path).lstrip('/')
+    # path-style URLs (S3_ENDPOINT_URL, local storage) start with the bucket
+    bucket_prefix = f"{bucket_name}/"
+    if (path.startswith(bucket_prefix)
+            and not (parts.hostname or '').startswith(f"{bucket_name}.")):
+        path = path[len(bucket_prefix):]
+    return path
 
 
 def get_seed_image():
     """Get the seed image URL for the current day or default seed image."""
+    day = today()
+    logging.info('Today date: ' + str(day))
+
+    try:
+        # the winner of a closed day does not change, so resolve it once
+        # per date instead of on every /generate load
+        s3_path = seed_image_cache.get_or_load(
+            day, lambda: _load_seed_s3_path(day))
+    except Exception as e:
+        logging.error(f"Error fetching seed image: {e}")
+        s3_path = None
+
+    if s3_path:
+        # a presigned or proxy URL rather than the direct S3 URL, which
+        # addresses the CORS issue
+        seed_image_url = image_urls([s3_path])[s3_path]
+        logging.info(f"Seed image URL: {seed_image_url}")
+        return seed_image_url
+
+    # if no previous images or error, return default seed image
+    seed_image_url = url_for(
+        'static', filename='data/seed_image.jpg', _external=True)
+    return seed_image_url
+
+
+def _resolve_seed_s3_path(today):
+    """Return the s3_path of the most recent previous day's winner, or None."""
     try:
         db_conn = get_db_connection()
         cursor = db_conn.cursor(dictionary=True)
 
-        today = datetime.now().date()
-        logging.info('Today date: ' + str(today))
-
-        # check if there are any previous days with images
+        # the latest previous day with images (they set seed_image_id,
+        # which vote flushes keep pointing at the day's leader)
         cursor.execute("""
-            SELECT DISTINCT day FROM Image
-            WHERE day < %s
-            ORDER BY day DESC
+            SELECT d.date, d.is_frozen, d.winner_s3_path,
+                   i.s3_path AS leader_s3_path
+            FROM Day d
+            LEFT JOIN Image i ON i.image_id = d.seed_image_id
+            WHERE d.date < %s AND d.seed_image_id IS NOT NULL
+            ORDER BY d.date DESC
             LIMIT 1
         """, (today,))
         day_row = cursor.fetchone()
 
-        if day_row:
-            previous_day = day_row['day']
-            logging.info('previous day date: ' + str(previous_day))
-            # find the image with the highest upvotes for that day
-            cursor.execute("""
-                SELECT s3_path FROM Image
-                WHERE day = %s
-                ORDER BY upvotes DESC, downvotes ASC, created_at ASC
-                LIMIT 1
-            """, (previous_day,))
-            image_row = cursor.fetchone()
-            if image_row:
-                s3_path = image_row['s3_path']
-                # use the proxy URL instead of direct S3 URL - addresses CORS
-                # issue
-                seed_image_url = (
-                    f"/proxy-image?url=https://{bucket_name}.s3.amazonaws.com/{s3_path}")
-                logging.info(f"Seed image URL: {seed_image_url}")
-                return seed_image_url
-
-        # if no previous images or error, return default seed image
-        seed_image_url = url_for(
-            'static', filename='data/seed_image.jpg', _external=True)
-        return seed_image_url
-
-    except Exception as e:
-        logging.error(f"Error fetching seed image: {e}")
-        # return default seed image in case of error
-        seed_image_url = url_for(
-            'static', filename='data/seed_image.jpg', _external=True)
-        return seed_image_url
-
     finally:
         if 'cursor' in locals():
             cursor.close()
         if 'db_conn' in locals():
             db_conn.close()
 
+    if not day_row:
+        return None
+
+    previous_day = day_row['date']
+    logging.info('previous day date: ' + str(previous_day))
+    # finalize.py has recorded the winner of a frozen day
+    if day_row['is_frozen']:
+        return day_row['winner_s3_path']
+    return day_row['leader_s3_path']
+
+
+def get_seed_png(seed_key):
+    """
+    Return the seed as ready-to-send 512x512 RGBA PNG bytes.
+    seed_key is an S3 path, or DEFAULT_SEED_KEY for the static seed.
+    """
+    cached = seed_png_cache.get(seed_key)
+    if cached:
+        return cached[0]
+
+    if seed_key == DEFAULT_SEED_KEY:
+        with open(DEFAULT_SEED_PATH, 'rb') as f:
+            seed_image_data = f.read()
+    else:
+        response = s3_client.get_object(Bucket=bucket_name, Key=seed_key)
+        seed_image_data = response['Body'].read()
+
+    with span('image', 'seed_png'):
+        seed_png = prepare_seed_png(seed_image_data, DALLE_SIZE)
+    seed_png_cache.put(seed_key, seed_png)
+    return seed_png
+
+
+def _warm_seed_png(seed_key):
+    """Preprocess a newly chosen seed in the background."""
+    try:
+        get_seed_png(seed_key)
+        logging.info(f"Preprocessed seed image cached: {seed_key}")
+    except Exception as e:
+        logging.error(f"Error preprocessing seed image {seed_key}: {e}")
+
+
+def _load_seed_s3_path(today):
+    """Resolve the day's seed and start preprocessing it for /generate-image."""
+    s3_path = _resolve_seed_s3_path(today)
+    threading.Thread(
+        target=_warm_seed_png,
+        args=(s3_path or DEFAULT_SEED_KEY,),
+        daemon=True).start()
+    return s3_path
+
+
+def invalidate_seed_image(day=None):
+    """Forget the memoized seed for one date (or all dates)."""
+    seed_image_cache.invalidate(day)
 
 
-def insert_day(image_id, today):
+def save_submission(image_id, s3_path, prompt_text, creator_id, day,
+                    created_at):
+    """
+    Record an uploaded image in one transaction: upsert the Day, insert
+    the Image, make it the day's seed if it has none yet and count the
+    creator as a participant. Returns False if the image_id is already
+    recorded (a retried submission).
+    """
     try:
         db_conn = get_db_connection()
         cursor = db_conn.cursor()
 
-        logging.info("Database successfully connected")
-        logging.info(f'image_id: {image_id}')
-        logging.info(f'today date: {today}')
-
-        # first insert with NULL seed_image_id if record doesn't exist
         cursor.execute("""
             INSERT INTO Day (date, seed_image_id, total_votes, total_participants, is_current)
-            SELECT %s, NULL, 0, 0, TRUE
-            WHERE NOT EXISTS (SELECT 1 FROM Day WHERE date = %s)
-        """, (today, today))
+            VALUES (%s, NULL, 0, 0, TRUE)
+            ON DUPLICATE KEY UPDATE date = date
+        """, (day,))
 
-        db_conn.commit()
-        logging.info(f"Successfully added Day record for today: {today}")
+        try:
+            cursor.execute("""
+                INSERT INTO Image (
+                    image_id,
+                    s3_path,
+                    prompt_text,
+                    created_at,
+                    creator_id,
+                    day,
+                    upvotes,
+                    downvotes,
+                    flags
+                ) VALUES (%s, %s, %s, %s, %s, %s, 0, 0, 0)
+            """, (image_id, s3_path, prompt_text, created_at, creator_id, day))
+        except IntegrityError as e:
+            if e.errno != errorcode.ER_DUP_ENTRY:
+                raise
+            db_conn.rollback()
+            return False
 
-    except Exception as db_error:
-        logging.error(f"Database error: {db_error}")
-        raise
+        cursor.execute("""
+            UPDATE Day
+            SET seed_image_id = %s
+            WHERE date = %s AND seed_image_id IS NULL
+        """, (image_id, day))
+        Participants.record(cursor, day, creator_id)
+
+        db_conn.commit()
+        logging.info(f"Recorded image {image_id} for {day}")
     finally:
         if 'cursor' in locals():
             cursor.close()
         if 'db_conn' in locals():
             db_conn.close()
 
+    # keep an already-built leaderboard for this day in step
+    board = leaderboards.loaded(day)
+    if board is not None:
+        board.add_image(image_id, created_at, s3_path)
+    participants.remember(day, creator_id)
+    return True
 
-def process_mask_for_dalle(mask_data_url):
-    """
-    Process a mask from canvas data URL into the format DALL-E 2 expects:
-    - Transparent (alpha=0) for areas to edit
-    - Solid black (alpha=255) for areas to preserve
-    Returns mask in RGBA format
-    """
-    # Decode mask image from base64
-    header, encoded = mask_data_url.split(",", 1)
-    mask_data = base64.b64decode(encoded)
-    mask_image = Image.open(BytesIO(mask_data)).convert("RGBA")
 
-    # Get alpha channel
-    alpha = mask_image.split()[3]
+def find_submission(image_id):
+    """Return the generation result of a recorded image, or None."""
+    try:
+        db_conn = get_db_connection()
+        cursor = db_conn.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT image_id, s3_path, day, created_at
+            FROM Image
+            WHERE image_id = %s
+        """, (image_id,))
+        row = cursor.fetchone()
+    finally:
+        if 'cursor' in locals():
+            cursor.close()
+        if 'db_conn' in locals():
+            db_conn.close()
 
-    # Create new RGBA image
-    # Solid black with full alpha
-    final_mask = Image.new('RGBA', mask_image.size, (0, 0, 0, 255))
+    if row is None:
+        return None
+    return _generation_result(
+        row['image_id'], row['s3_path'], str(row['day']),
+        row['created_at'].strftime("%Y-%m-%d %H:%M:%S"))
 
-    # Create white areas with zero alpha where user drew
-    transparent_areas = Image.new('RGBA', mask_image.size, (0, 0, 0, 0))
-    final_mask.paste(transparent_areas, mask=Image.eval(
-        alpha, lambda x: 255 if x == 0 else 0))
 
-    return final_mask
+def _generation_result(image_id, s3_path, day, created_at):
+    return {
+        'imageUrl': f"https://{bucket_name}.s3.amazonaws.com/{s3_path}",
+        'image_id': image_id,
+        's3_path': s3_path,
+        'day': day,
+        'created_at': created_at
+    }
 
 
 ### endpoints ###
 
-@app.route('/generate-image', methods=['POST'])
-def generate_image_endpoint():
-    logging.info("Endpoint /generate-image was hit")
-
-    data = request.get_json()
+def _parse_generation_request(data):
+    """Validate a generation request body; returns (params, error)."""
+    if not isinstance(data, dict):
+        return None, 'Request body must be a JSON object'
     prompt = data.get('prompt')
-    mask_data_url = data.get('mask')
+    # PNG data URL, or a run-length mask from current pages
+    mask = data.get('mask')
     seed_image_url = data.get('seedImage')
     # format example: 11/30/2024, 11:29:07 PM
     created_at = data.get('createdAt')
+    creator_id = data.get('creatorId')
+    # reused by the client for retries of the same submission
+    idempotency_key = (data.get('idempotencyKey')
+                       or request.headers.get('Idempotency-Key'))
+
+    if not all([prompt, mask, seed_image_url, created_at]):
+        return None, 'Missing required parameters'
 
     # extract correct dates for database
-    date_obj = datetime.strptime(created_at, "%m/%d/%Y, %I:%M:%S %p")
-    formatted_created_at = date_obj.strftime("%Y-%m-%d %H:%M:%S")
-    today = date_obj.strftime("%Y-%m-%d")
+    try:
+        date_obj = datetime.strptime(created_at, "%m/%d/%Y, %I:%M:%S %p")
+    except ValueError:
+        return None, 'Invalid createdAt format'
+
+    if not (isinstance(mask, str) or is_mask_rle(mask)):
+        return None, 'Invalid mask'
+
+    if idempotency_key and len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        return None, 'Invalid idempotency key'
 
-    if not all([prompt, mask_data_url, seed_image_url]):
-        return jsonify({'error': 'Missing required parameters'}), 400
+    return {
+        'prompt': prompt,
+        'mask': mask,
+        'seed_image_url': seed_image_url,
+        'today': date_obj.strftime("%Y-%m-%d"),
+        'formatted_created_at': date_obj.strftime("%Y-%m-%d %H:%M:%S"),
+        'creator_id': creator_id,
+        'image_id': (submission_image_id(creator_id, idempotency_key)
+                     if idempotency_key else None),
+    }, None
 
+
+def _admit_generation(creator_id):
+    """
+    Admit a generation for creator_id (or the client address when the
+    page has no user id yet); returns (slot, error response).
+    """
+    key = f"creator:{creator_id}" if creator_id else f"ip:{request.remote_addr}"
     try:
-        # validate credentials
-        validate_env()
-        openai.api_key = OPENAI_API_KEY
-
-        # get seed image
-        if 'static/data/seed_image.jpg' in seed_image_url:
-            static_file_path = os.path.join(
-                app.static_folder, 'data', 'seed_image.jpg')
-            with open(static_file_path, 'rb') as f:
-                seed_image_data = f.read()
+        return admission.admit(key), None
+    except Rejected as e:
+        logging.warning(f"Generation for {key} rejected: {e.reason}")
+        if e.reason == 'rate_limited':
+            message = 'You are generating images too quickly, please wait a moment'
         else:
-            s3_path = seed_image_url.split(
-                '/proxy-image?url=https://' + bucket_name + '.s3.amazonaws.com/')[-1]
-            s3_client = boto3.client(
-                's3',
-                aws_access_key_id=AWS_ACCESS_KEY_ID,
-                aws_secret_access_key=AWS_SECRET_ACCESS_KEY)
-            response = s3_client.get_object(Bucket=bucket_name, Key=s3_path)
-            seed_image_data = response['Body'].read()
-
-        # process seed image (keep as RGBA)
-        seed_image = Image.open(BytesIO(seed_image_data)).convert("RGBA")
-        seed_image = seed_image.resize((512, 512))
-
-        # process mask image
-        mask_image = process_mask_for_dalle(mask_data_url)
-        mask_image = mask_image.resize((512, 512))
-
-        # save images to bytes
-        seed_bytes = BytesIO()
-        mask_bytes = BytesIO()
+            message = 'Too many images are being generated, please retry shortly'
+        response = jsonify({'error': message})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return None, (response, 429)
+
+
+def _run_admitted(slot, **params):
+    try:
+        return generate_image(**params)
+    finally:
+        admission.release(slot)
+
+
+def download_generated_image(image_url):
+    """Fetch a generated image from OpenAI's CDN (response_format='url')."""
+    with span('openai', 'download'):
+        image_response = download_session.get(
+            image_url,
+            timeout=(IMAGE_DOWNLOAD_CONNECT_TIMEOUT, IMAGE_DOWNLOAD_READ_TIMEOUT))
+    if image_response.status_code != 200:
+        raise Exception(f"Failed to download generated image: {image_response.status_code}")  # noqa: E501
+    return image_response.content
 
-        seed_image.save(seed_bytes, format='PNG')
-        mask_image.save(mask_bytes, format='PNG')
 
-        seed_bytes.seek(0)
+def generate_image(prompt, mask, seed_image_url, today,
+                   formatted_created_at, creator_id=None, image_id=None):
+    """
+    Run the full submission pipeline: DALL-E edit, upload to S3, then
+    the Image and Day rows in one transaction. Returns the JSON-ready
+    result; raises on failure.
+    An `image_id` derived from an idempotency key makes retries return
+    the recorded result instead of generating again.
+    """
+    if image_id:
+        existing = find_submission(image_id)
+        if existing:
+            logging.info(f"Submission {image_id} already recorded")
+            return existing
+    else:
+        image_id = str(uuid.uuid4())
+
+    # per-stage wall time in ms, logged once the image is stored
+    timings = {}
+    stage_start = time.monotonic()
+
+    def stage_done(name):
+        nonlocal stage_start
+        now = time.monotonic()
+        timings[name] = (now - stage_start) * 1000
+        stage_seconds.observe(now - stage_start, kind='generation', operation=name)
+        stage_start = now
+
+    # get the preprocessed seed image
+    if DEFAULT_SEED_KEY in seed_image_url:
+        seed_key = DEFAULT_SEED_KEY
+    else:
+        seed_key = _s3_path_from_url(seed_image_url)
+    seed_bytes = BytesIO(get_seed_png(seed_key))
+    stage_done('seed')
+
+    # process mask image (thresholded and resized in one pass)
+    with span('image', 'mask'):
+        mask_image = process_mask_for_dalle(mask, DALLE_SIZE)
+        mask_bytes = BytesIO()
+        mask_image.save(mask_bytes, format='PNG')
         mask_bytes.seek(0)
+    stage_done('mask')
 
-        # call DALL-E 2 API
-        response = openai.images.edit(
+    # call DALL-E 2 API
+    with span('openai', 'images.edit'):
+        response = get_openai_client().images.edit(
             model="dall-e-2",
             image=seed_bytes,
             mask=mask_bytes,
             prompt=prompt,
             n=1,
-            size="512x512"
+            size="512x512",
+            response_format=OPENAI_RESPONSE_FORMAT
         )
+    stage_done('openai')
+
+    # process response and save to S3
+    generated = response.data[0]
+    if generated.b64_json:
+        image_data = base64.b64decode(generated.b64_json)
+    else:
+        logging.info(f"Generated image URL: {generated.url}")
+        image_data = download_generated_image(generated.url)
+        stage_done('download')
+    logging.info(f"Image successfully generated by Dalle 2")
+
+    # S3 path from the image id
+    s3_path = f'daily-submissions/{today}/{image_id}.png'
+
+    # a concurrent retry may have recorded this submission meanwhile
+    existing = find_submission(image_id)
+    if existing:
+        logging.info(f"Submission {image_id} already recorded")
+        return existing
+
+    # upload to S3, unless another attempt already did
+    uploaded = upload_submission(s3_path, image_data)
+    stage_done('upload')
+
+    # grid thumbnails; the proxy falls back to the original without them
+    if uploaded:
+        try:
+            upload_derivatives(s3_path, image_data)
+        except Exception as e:
+            logging.error(f"Error creating derivatives for {s3_path}: {e}")
+    stage_done('thumbnails')
+
+    # Image and Day rows in one transaction; on failure the upload is
+    # removed here, or by the orphan sweep if this process dies first
+    try:
+        recorded = save_submission(
+            image_id, s3_path, prompt, creator_id, today, formatted_created_at)
+    except Exception:
+        try:
+            # keep objects another attempt uploaded or recorded
+            if uploaded and find_submission(image_id) is None:
+                delete_submission_objects(s3_path)
+        except Exception as e:
+            logging.error(f"Error removing upload {s3_path}: {e}")
+        raise
+    stage_done('db')
+    if not recorded:
+        # a concurrent retry of the same submission committed first
+        logging.info(f"Submission {image_id} already recorded")
+        return find_submission(image_id)
 
-        # process response and save to S3
-        image_url = response.data[0].url
-        logging.info(f"Generated image URL: {image_url}")
+    logging.info(
+        f"Generated {image_id} in {sum(timings.values()):.0f}ms ("
+        + ', '.join(f"{name} {ms:.0f}ms" for name, ms in timings.items())
+        + ")")
 
-        # download generated image
-        image_response = requests.get(image_url)
-        if image_response.status_code != 200:
-            raise Exception(f"Failed to download generated image: {image_response.status_code}")  # noqa: E501
-        else:
-            logging.info(f"Image successfully generated by Dalle 2")
+    return _generation_result(image_id, s3_path, today, formatted_created_at)
 
-        # generate unique ID and S3 path
-        image_id = str(uuid.uuid4())
-        s3_path = f'daily-submissions/{today}/{image_id}.png'
-
-        # upload to S3
-        s3_client = boto3.client('s3',
-                                 aws_access_key_id=AWS_ACCESS_KEY_ID,
-                                 aws_secret_access_key=AWS_SECRET_ACCESS_KEY
-                                 )
-        s3_client.put_object(
-            Bucket=bucket_name,
-            Key=s3_path,
-            Body=image_response.content,
-            ContentType='image/png',
-        )
 
-        # insert day record
-        insert_day(image_id, today)
+@bp.route('/generate-image', methods=['POST'])
+def generate_image_endpoint():
+    logging.info("Endpoint /generate-image was hit")
+
+    params, error = _parse_generation_request(request.get_json() or {})
+    if error:
+        return jsonify({'error': error}), 400
 
+    slot, rejection = _admit_generation(params['creator_id'])
+    if rejection:
+        return rejection
+
+    try:
         # return success response
-        full_image_url = f"https://{bucket_name}.s3.amazonaws.com/{s3_path}"
-        return jsonify({
-            'imageUrl': full_image_url,
-            'image_id': image_id,
-            'day': today,
-            'created_at': formatted_created_at
-        }), 200
+        return jsonify(_run_admitted(slot, **params)), 200
 
-    except openai.OpenAIError as e:
-        logging.error(f"OpenAI API error: {e}")
-        return jsonify({'error': str(e)}), 500
     except Exception as e:
-        logging.error(f"Error in generate_image_endpoint: {e}")
+        if _is_openai_error(e):
+            logging.error(f"OpenAI API error: {e}")
+        else:
+            logging.error(f"Error in generate_image_endpoint: {e}")
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/track-user', methods=['POST'])
+@bp.route('/generation-jobs', methods=['POST'])
+def submit_generation_job():
+    """Queue a generation and return its job id without waiting for it."""
+    logging.info("Endpoint /generation-jobs was hit")
+
+    params, error = _parse_generation_request(request.get_json() or {})
+    if error:
+        return jsonify({'error': error}), 400
+
+    # a retry of a submission that is still running or done isn't
+    # charged again
+    job_id = generation_jobs.find(params['image_id'])
+    if job_id is None:
+        slot, rejection = _admit_generation(params['creator_id'])
+        if rejection:
+            return rejection
+
+        try:
+            job_id, created = generation_jobs.submit(
+                _run_admitted, slot, job_key=params['image_id'], **params)
+        except QueueFull:
+            admission.release(slot, refund=True)
+            logging.warning(
+                f"Generation queue full: {generation_jobs.stats()}")
+            response = jsonify(
+                {'error': 'Too many images are being generated, please retry shortly'})
+            response.headers['Retry-After'] = str(GENERATION_RETRY_AFTER)
+            return response, 503
+        except Exception as e:
+            admission.release(slot, refund=True)
+            logging.error(f"Error in submit_generation_job: {e}")
+            return jsonify({'error': str(e)}), 500
+        if not created:
+            # a concurrent retry queued the job first; this one never runs
+            admission.release(slot, refund=True)
+
+    # a retry may get back a job that is already running or finished
+    body = _job_body(generation_jobs.get(job_id) or {
+        'job_id': job_id, 'status': 'queued'})
+    body['status_url'] = url_for('.get_generation_job', job_id=job_id)
+    return jsonify(body), 202
+
+
+def _job_body(job):
+    body = {'job_id': job['job_id'], 'status': job['status']}
+    if job['status'] == 'succeeded':
+        body.update(job['result'])
+    elif job['status'] == 'failed':
+        body['error'] = job['error']
+    return body
+
+
+@bp.route('/generation-jobs/<job_id>', methods=['GET'])
+def get_generation_job(job_id):
+    job = generation_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    return jsonify(_job_body(job)), 200
+
+
+@bp.route('/track-user', methods=['POST'])
 def track_user():
     logging.info("Endpoint /track-user was hit")
     data = request.get_json()
@@ -334,7 +774,7 @@ def track_user():
             db_conn.close()
 
 
-@app.route('/insert-image', methods=['POST'])
+@bp.route('/insert-image', methods=['POST'])
 def insert_image():
     logging.info("Endpoint /insert-image was hit")
     data = request.get_json()
@@ -380,9 +820,16 @@ def insert_image():
             SET seed_image_id = %s
             WHERE date = %s AND seed_image_id IS NULL
         """, (image_id, day))
+        Participants.record(cursor, day, creator_id)
 
         db_conn.commit()
 
+        # keep an already-built leaderboard for this day in step
+        board = leaderboards.loaded(day)
+        if board is not None:
+            board.add_image(image_id, created_at, s3_path, upvotes, downvotes)
+        participants.remember(day, creator_id)
+
         logging.info("Successfully loaded into Image table!")
 
         return jsonify({'message': 'Image inserted successfully'}), 201
@@ -397,17 +844,64 @@ def insert_image():
             db_conn.close()
 
 
-@app.route('/get-images', methods=['GET'])
+# columns /get-images may return; image_id and created_at drive the cursor
+IMAGE_FIELDS = ('image_id', 's3_path', 'prompt_text', 'upvotes', 'downvotes', 'created_at')
+DEFAULT_IMAGE_FIELDS = ('image_id', 's3_path', 'prompt_text', 'upvotes', 'downvotes')
+
+
+def _encode_cursor(created_at, image_id):
+    raw = f"{created_at.strftime('%Y-%m-%d %H:%M:%S')}|{image_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor_token):
+    created_at, image_id = base64.urlsafe_b64decode(
+        cursor_token.encode()).decode().split('|', 1)
+    return datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S'), image_id
+
+
+def _day_images_etag(cursor, day):
+    """
+    Weak ETag for a day's images: changes whenever an image is added or
+    any vote count changes. Answered from the (day, upvotes, downvotes,
+    created_at) index without touching the rows.
+    """
+    cursor.execute("""
+        SELECT COUNT(*) AS images, MAX(created_at) AS latest,
+               BIT_XOR(CRC32(CONCAT(image_id, ':', upvotes, ':', downvotes))) AS votes
+        FROM Image
+        WHERE day = %s
+    """, (day,))
+    row = cursor.fetchone()
+    return f"{day}-{row['images']}-{row['latest']}-{row['votes']}".replace(' ', 'T')
+
+
+@bp.route('/get-images', methods=['GET'])
 def get_images():
     logging.info("Endpoint /get-images was hit")
     day = request.args.get('day')
 
     if not day:
         return jsonify({'message': 'Day is required'}), 400
-    
-    date_obj = datetime.strptime(day, "%m/%d/%Y, %I:%M:%S %p")
+
+    try:
+        date_obj = datetime.strptime(day, "%m/%d/%Y, %I:%M:%S %p")
+        limit = int(request.args.get('limit', GET_IMAGES_PAGE_SIZE))
+        after = request.args.get('cursor')
+        after = _decode_cursor(after) if after else None
+    except ValueError:
+        return jsonify({'error': 'Invalid day, limit or cursor'}), 400
     day = date_obj.strftime("%Y-%m-%d")
     logging.info(f"Day in get-images endpoint: {day}") # should be in YYYY-MM-DD format
+    limit = max(1, min(limit, GET_IMAGES_MAX_PAGE_SIZE))
+    size = _thumbnail_size(request.args.get('size'))
+
+    fields = request.args.get('fields')
+    fields = fields.split(',') if fields else list(DEFAULT_IMAGE_FIELDS)
+    unknown = [field for field in fields if field not in IMAGE_FIELDS]
+    if unknown:
+        return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+    columns = list(dict.fromkeys(fields + ['created_at', 'image_id']))
 
     try:
         db_conn = get_db_connection()
@@ -415,21 +909,48 @@ def get_images():
 
         logging.info("Database successfully connected")
 
-        # query for images for the given day
-        cursor.execute("""
-            SELECT image_id, s3_path, prompt_text, upvotes, downvotes
+        etag = _day_images_etag(cursor, day)
+        if presigned_urls is not None:
+            # pages embed presigned URLs, so don't revalidate them forever
+            etag = f"{etag}-{presigned_urls.epoch()}"
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+            response.set_etag(etag, weak=True)
+            return response
+
+        # keyset pagination: newest first, continuing after the cursor
+        keyset = ''
+        params = [day]
+        if after:
+            keyset = 'AND (created_at < %s OR (created_at = %s AND image_id < %s))'
+            params += [after[0], after[0], after[1]]
+        cursor.execute(f"""
+            SELECT {', '.join(columns)}
             FROM Image
-            WHERE day = %s
-            ORDER BY created_at DESC
-        """, (day,))
-
-        images = cursor.fetchall()
+            WHERE day = %s {keyset}
+            ORDER BY created_at DESC, image_id DESC
+            LIMIT %s
+        """, params + [limit + 1])
+
+        rows = cursor.fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1]['created_at'], rows[-1]['image_id'])
+        images = [{field: row[field] for field in fields} for row in rows]
+        if 's3_path' in fields:
+            urls = image_urls([image['s3_path'] for image in images], size)
+            for image in images:
+                image['image_url'] = urls[image['s3_path']]
 
         if images:
-            return jsonify({'images': images}), 200
+            body = {'images': images, 'next_cursor': next_cursor}
         else:
-            return jsonify(
-                {'message': 'Looks like there were no images from today!'}), 200
+            body = {'images': [], 'next_cursor': None,
+                    'message': 'Looks like there were no images from today!'}
+        response = jsonify(body)
+        response.set_etag(etag, weak=True)
+        return response, 200
 
     except Exception as e:
         logging.error(f"Error fetching images: {e}")
@@ -441,7 +962,7 @@ def get_images():
             db_conn.close()
 
 
-@app.route('/vote-image', methods=['POST'])
+@bp.route('/vote-image', methods=['POST'])
 def vote_image():
     data = request.get_json()
     image_id = data.get('image_id')
@@ -452,64 +973,160 @@ def vote_image():
         return jsonify({'error': 'Invalid image ID or vote values'}), 400
 
     try:
-        db_conn = get_db_connection()
-        cursor = db_conn.cursor()
-
         # Calculate the changes in upvotes and downvotes
-        upvote_change = 0
-        downvote_change = 0
-
-        if current_vote == 0 and new_vote == 1:
-            upvote_change = 1
-        elif current_vote == 1 and new_vote == 0:
-            upvote_change = -1
-        elif current_vote == 1 and new_vote == -1:
-            upvote_change = -1
-            downvote_change = 1
-        elif current_vote == 0 and new_vote == -1:
-            downvote_change = 1
-        elif current_vote == -1 and new_vote == 0:
-            downvote_change = -1
-        elif current_vote == -1 and new_vote == 1:
-            downvote_change = -1
-            upvote_change = 1
-
-        # Update votes for the image
-        cursor.execute(
-            "UPDATE Image SET upvotes = GREATEST(0, upvotes + %s), downvotes = GREATEST(0, downvotes + %s) WHERE image_id = %s",
-            (upvote_change, downvote_change, image_id)
-        )
+        upvote_change, downvote_change = vote_deltas(current_vote, new_vote)
 
-        # Get the day for this image
-        cursor.execute(
-            "SELECT day FROM Image WHERE image_id = %s", (image_id,))
-        day_result = cursor.fetchone()
-        if day_result:
-            day = day_result[0]
-
-            # Find the image with the highest upvotes for this day
-            cursor.execute("""
-                SELECT image_id FROM Image 
-                WHERE day = %s 
-                ORDER BY upvotes DESC, downvotes ASC, created_at ASC 
-                LIMIT 1
-            """, (day,))
-            highest_voted = cursor.fetchone()
-
-            if highest_voted:
-                # Update the Day table with the highest voted image
-                cursor.execute("""
-                    UPDATE Day 
-                    SET seed_image_id = %s 
-                    WHERE date = %s
-                """, (highest_voted[0], day))
-
-        db_conn.commit()
+        # merged with other votes and written in batches by the flusher
+        vote_buffer.add(image_id, upvote_change, downvote_change)
         return jsonify({'message': 'Vote recorded successfully'}), 200
 
     except Exception as e:
         logging.error(f"Error voting on image: {e}")
         return jsonify({'error': 'Failed to record vote'}), 500
+
+
+@bp.route('/votes', methods=['POST'])
+def vote_batch():
+    """
+    Record a batch of vote transitions and the matching total_votes
+    change. Body: {"votes": [{"image_id", "current_vote", "new_vote"}],
+    "total_votes_increment": n}. Deltas for the same image are merged
+    and the whole batch is buffered together, so one flush transaction
+    writes all of it.
+    """
+    data = request.get_json() or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    votes = data.get('votes')
+    if not isinstance(votes, list) or not votes:
+        return jsonify({'error': 'votes must be a non-empty list'}), 400
+    if len(votes) > VOTE_BATCH_MAX_SIZE:
+        return jsonify({'error': f"At most {VOTE_BATCH_MAX_SIZE} votes per batch"}), 400
+
+    deltas = {}
+    total_votes = 0
+    for index, vote in enumerate(votes):
+        image_id = vote.get('image_id') if isinstance(vote, dict) else None
+        current_vote = vote.get('current_vote') if image_id else None
+        new_vote = vote.get('new_vote') if image_id else None
+        if (not isinstance(image_id, str) or current_vote not in [-1, 0, 1]
+                or new_vote not in [-1, 0, 1]):
+            return jsonify({'error': f"Invalid image ID or vote values at index {index}"}), 400
+
+        upvote_change, downvote_change = vote_deltas(current_vote, new_vote)
+        up, down = deltas.get(image_id, (0, 0))
+        deltas[image_id] = (up + upvote_change, down + downvote_change)
+        # a vote counts once towards total_votes while it is selected
+        total_votes += (new_vote != 0) - (current_vote != 0)
+
+    increment = data.get('total_votes_increment', total_votes)
+    if increment != total_votes:
+        return jsonify({'error': 'total_votes_increment does not match the votes'}), 400
+
+    try:
+        vote_buffer.add_many(deltas, today(), total_votes)
+        return jsonify({'message': 'Votes recorded successfully',
+                        'images': len(deltas)}), 200
+
+    except Exception as e:
+        logging.error(f"Error recording vote batch: {e}")
+        return jsonify({'error': 'Failed to record votes'}), 500
+
+
+def _on_votes_flushed(changes):
+    current = today()
+    if any(day < current for day in changes):
+        # a late vote on a closed day can change today's seed
+        invalidate_seed_image()
+    for day, (counts, leader) in changes.items():
+        vote_events.publish(day, counts, leader)
+
+
+# live count updates for /votes/stream viewers
+vote_events = VoteEvents(
+    VOTE_STREAM_COALESCE_INTERVAL, VOTE_STREAM_BUFFER_SIZE,
+    VOTE_STREAM_MAX_CLIENTS)
+
+
+vote_buffer = VoteBuffer(
+    get_db_connection, leaderboards, VOTE_FLUSH_INTERVAL,
+    VOTE_FLUSH_MAX_PENDING, on_flush=_on_votes_flushed)
+
+
+@bp.route('/votes/stream', methods=['GET'])
+def vote_stream():
+    """
+    Server-Sent Events with the vote counts of a day (YYYY-MM-DD,
+    default today). Each 'votes' event carries
+    {"day", "counts": {image_id: [upvotes, downvotes]}, "leader"?} for
+    the images whose votes changed; 'reset' means refetch /get-images.
+    """
+    if VOTE_STREAM_MAX_CLIENTS <= 0:
+        return jsonify({'error': 'Vote streaming is disabled'}), 404
+
+    day = request.args.get('day') or today().isoformat()
+    try:
+        day = datetime.strptime(day, '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'error': 'Invalid day'}), 400
+
+    try:
+        subscriber = vote_events.subscribe(
+            day, request.headers.get('Last-Event-ID'))
+    except TooManySubscribers:
+        response = jsonify({'error': 'Too many open vote streams'})
+        response.headers['Retry-After'] = str(VOTE_STREAM_MAX_DURATION)
+        return response, 503
+
+    response = Response(
+        vote_events.stream(day, subscriber, VOTE_STREAM_KEEPALIVE,
+                           VOTE_STREAM_MAX_DURATION),
+        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # stop nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@bp.route('/votes/counts', methods=['GET'])
+def vote_counts():
+    """
+    Current vote counts of the given images (ids=a,b,c) and the leader
+    of their day (YYYY-MM-DD, default today), for vote pages that poll
+    instead of streaming. Primary-key lookups only.
+    """
+    day = request.args.get('day') or today().isoformat()
+    try:
+        day = datetime.strptime(day, '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'error': 'Invalid day'}), 400
+    image_ids = [image_id for image_id in request.args.get('ids', '').split(',')
+                 if image_id]
+    if len(image_ids) > GET_IMAGES_MAX_PAGE_SIZE:
+        return jsonify({'error': f"At most {GET_IMAGES_MAX_PAGE_SIZE} ids per request"}), 400
+
+    try:
+        db_conn = get_db_connection()
+        cursor = db_conn.cursor()
+        counts = {}
+        if image_ids:
+            placeholders = ', '.join(['%s'] * len(image_ids))
+            cursor.execute(f"""
+                SELECT image_id, upvotes, downvotes
+                FROM Image WHERE image_id IN ({placeholders})
+            """, image_ids)
+            counts = {image_id: [upvotes, downvotes]
+                      for image_id, upvotes, downvotes in cursor.fetchall()}
+        cursor.execute("SELECT seed_image_id FROM Day WHERE date = %s", (day,))
+        row = cursor.fetchone()
+        response = jsonify({'day': day.isoformat(), 'counts': counts,
+                            'leader': row[0] if row else None})
+        response.cache_control.no_cache = True
+        return response, 200
+
+    except Exception as e:
+        logging.error(f"Error fetching vote counts: {e}")
+        return jsonify({'error': 'Failed to fetch vote counts'}), 500
     finally:
         if 'cursor' in locals():
             cursor.close()
@@ -517,7 +1134,96 @@ def vote_image():
             db_conn.close()
 
 
-@app.route('/proxy-image')
+@bp.route('/leaderboard', methods=['GET'])
+def get_leaderboard():
+    """Current ranking for a day (YYYY-MM-DD, default today)."""
+    day = request.args.get('day') or today().isoformat()
+    try:
+        day = datetime.strptime(day, '%Y-%m-%d').date()
+        limit = int(request.args.get('limit', 10))
+    except ValueError:
+        return jsonify({'error': 'Invalid day or limit'}), 400
+    limit = max(1, min(limit, LEADERBOARD_MAX_LIMIT))
+
+    try:
+        board = leaderboards.get(day)
+        ranking = board.top(limit)
+        for row in ranking:
+            row['created_at'] = row['created_at'].strftime('%Y-%m-%d %H:%M:%S')
+        return jsonify({
+            'day': day.isoformat(),
+            'total_images': len(board),
+            'leader': ranking[0] if ranking else None,
+            'ranking': ranking,
+        }), 200
+
+    except Exception as e:
+        logging.error(f"Error fetching leaderboard: {e}")
+        return jsonify({'error': 'Failed to fetch leaderboard'}), 500
+
+
+def _image_headers(response, metadata, immutable):
+    """Attach validators and caching policy to a proxied image response."""
+    response.set_etag(metadata['etag'])
+    response.last_modified = metadata['last_modified']
+    if immutable:
+        response.cache_control.public = True
+        response.cache_control.max_age = PROXY_CACHE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        # unknown objects may change, so make browsers revalidate
+        response.cache_control.no_cache = True
+    return response
+
+
+def _object_metadata(s3_response):
+    return {
+        'etag': s3_response['ETag'].strip('"'),
+        'last_modified': s3_response['LastModified'],
+        'content_type': s3_response.get('ContentType') or 'image/png',
+    }
+
+
+def _sized_s3_path(s3_path, size):
+    """
+    Key of the requested thumbnail size, or the original when no size
+    is asked for or that derivative has not been created yet.
+    """
+    size = _thumbnail_size(size)
+    if not size:
+        return s3_path
+    sized_path = derivative_key(s3_path, size)
+    # the caller's proxy_cache.get() counts the hit or miss
+    if sized_path in proxy_cache:
+        return sized_path
+    exists = derivative_lookups.get(sized_path)
+    if exists is None:
+        try:
+            s3_client.head_object(Bucket=bucket_name, Key=sized_path)
+            exists = True
+        except Exception as e:
+            if _s3_error_code(e) not in ('NoSuchKey', '404'):
+                raise
+            exists = False
+        derivative_lookups.put(sized_path, exists)
+    return sized_path if exists else s3_path
+
+
+def _s3_error_code(error):
+    """Return the S3 error code of a botocore ClientError, if any."""
+    return getattr(error, 'response', {}).get('Error', {}).get('Code')
+
+
+def _stream_body(body):
+    """Yield an S3 body in fixed-size chunks so memory use stays bounded."""
+    try:
+        for chunk in body.iter_chunks(PROXY_STREAM_CHUNK_SIZE):
+            yield chunk
+    finally:
+        body.close()
+
+
+@bp.route('/proxy-image')
 def proxy_image():
     image_url = request.args.get('url')
     if not image_url:
@@ -525,36 +1231,80 @@ def proxy_image():
 
     try:
         # parse the S3 path from the full URL
-        s3_path = image_url.split('amazonaws.com/')[-1].split('?')[0]
+        s3_path = _s3_path_from_url(image_url)
+        # submissions are written once under a unique key and never changed
+        immutable = s3_path.startswith(IMMUTABLE_IMAGE_PREFIX)
+        if immutable:
+            s3_path = _sized_s3_path(s3_path, request.args.get('size'))
+        # only single byte ranges are served; multi-range requests get
+        # the whole object
+        single_range = request.range is None or len(request.range.ranges) == 1
+
+        cached = proxy_cache.get(s3_path) if immutable else None
+        if cached:
+            body, metadata = cached
+            response = Response(body, mimetype=metadata['content_type'])
+            response.headers['X-Cache'] = 'HIT'
+            return _image_headers(response, metadata, immutable).make_conditional(
+                request, accept_ranges=single_range, complete_length=len(body))
+
+        if request.if_none_match or request.if_modified_since:
+            # revalidation: answer from object metadata without
+            # downloading the body
+            head = s3_client.head_object(Bucket=bucket_name, Key=s3_path)
+            metadata = _object_metadata(head)
+            response = _image_headers(
+                Response(mimetype=metadata['content_type']),
+                metadata, immutable).make_conditional(request)
+            if response.status_code == 304:
+                return response
+
+        # pass single byte ranges through to S3
+        get_args = {}
+        if request.range and single_range:
+            get_args['Range'] = request.range.to_header()
 
         # get the image from S3
-        s3_client = boto3.client(
-            's3',
-            aws_access_key_id=AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=AWS_SECRET_ACCESS_KEY
-        )
-
-        response = s3_client.get_object(
+        s3_response = s3_client.get_object(
             Bucket=bucket_name,
-            Key=s3_path
-        )
-
-        # return the image with proper headers
-        return Response(
-            response['Body'].read(),
-            mimetype='image/png',
-            headers={
-                'Cache-Control': 'no-cache, no-store, must-revalidate',
-                'Pragma': 'no-cache',
-                'Expires': '0'
-            }
+            Key=s3_path,
+            **get_args
         )
+        metadata = _object_metadata(s3_response)
+        content_length = s3_response['ContentLength']
+
+        if (immutable and not get_args
+                and content_length <= proxy_cache.max_item_bytes):
+            # small enough to keep: read once and serve from the cache
+            body = s3_response['Body'].read()
+            proxy_cache.put(s3_path, body, metadata)
+            response = Response(body, mimetype=metadata['content_type'])
+            response.headers['X-Cache'] = 'MISS'
+            return _image_headers(response, metadata, immutable).make_conditional(
+                request, accept_ranges=single_range, complete_length=len(body))
+
+        # stream large objects and partial content straight from S3
+        response = Response(
+            _stream_body(s3_response['Body']),
+            mimetype=metadata['content_type'],
+            direct_passthrough=True)
+        response.headers['Content-Length'] = str(content_length)
+        response.headers['Accept-Ranges'] = 'bytes'
+        response.headers['X-Cache'] = 'MISS'
+        if s3_response.get('ContentRange'):
+            response.status_code = 206
+            response.headers['Content-Range'] = s3_response['ContentRange']
+        return _image_headers(response, metadata, immutable)
+    except RequestedRangeNotSatisfiable as e:
+        return e
     except Exception as e:
+        if _s3_error_code(e) == 'InvalidRange':
+            return 'Requested range not satisfiable', 416
         logging.error(f"Error proxying image: {e}")
         return 'Error fetching image', 500
 
 
-@app.route('/update-vote-count', methods=['POST'])
+@bp.route('/update-vote-count', methods=['POST'])
 def update_vote_count():
     data = request.get_json()
     # +1 for upvote/downvote, -1 for deselect
@@ -567,17 +1317,17 @@ def update_vote_count():
         cursor = db_conn.cursor()
 
         # Get today's date
-        today = datetime.now().strftime('%Y-%m-%d')
+        day = today().isoformat()
         logging.info(
-            f"Updating total_votes for date: {today} "
+            f"Updating total_votes for date: {day} "
             f"with increment: {increment}"
         )
 
         # Update total_votes for the current day
         cursor.execute("""
             UPDATE Day SET total_votes = total_votes + %s
-            WHERE date = %s
-        """, (increment, today))
+            WHERE date = %s AND NOT is_frozen
+        """, (increment, day))
         db_conn.commit()
 
         logging.info("Total votes updated successfully")
@@ -594,7 +1344,7 @@ def update_vote_count():
             db_conn.close()
 
 
-@app.route('/increment-participant', methods=['POST'])
+@bp.route('/increment-participant', methods=['POST'])
 def increment_participant():
     data = request.get_json()
     user_id = data.get('user_id')
@@ -608,53 +1358,48 @@ def increment_participant():
         return jsonify({'error': 'User ID is required'}), 400
 
     try:
-        db_conn = get_db_connection()
-        cursor = db_conn.cursor()
-
-        # Check if the user has generated at least one image
-        cursor.execute("""
-            SELECT COUNT(*) FROM Image WHERE creator_id = %s
-        """, (user_id,))
-        image_count = cursor.fetchone()[0]
-
-        if image_count > 0:
-            # Increment participant count
-            cursor.execute("""
-                UPDATE Day SET total_participants = total_participants + 1 WHERE date = %s
-            """, (today,))
-            db_conn.commit()
-            return jsonify(
-                {'message': 'Participant incremented successfully'}), 200
+        # participants are counted once per day when their image is
+        # recorded; this only confirms it, so reloads don't count twice
+        if participants.has_participated(today, user_id):
+            return jsonify({'message': 'Participant recorded'}), 200
         else:
             return jsonify(
-                {'message': 'User has not generated any images'}), 400
+                {'message': 'User has not generated any images today'}), 400
 
     except Exception as e:
         logging.error(f"Error incrementing participant: {e}")
         return jsonify({'error': 'Failed to increment participant'}), 500
 
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if 'db_conn' in locals():
-            db_conn.close()
 
-
-@app.route('/get-history')
+@bp.route('/get-history')
 def get_history():
     try:
         db_conn = get_db_connection()
         cursor = db_conn.cursor(dictionary=True)
 
+        # frozen days carry their winner's path; only open days need
+        # the Image lookup
         cursor.execute("""
-            SELECT d.date, i.s3_path
+            SELECT d.date, COALESCE(d.winner_s3_path, i.s3_path) AS s3_path
             FROM Day d
-            JOIN Image i ON d.seed_image_id = i.image_id
+            LEFT JOIN Image i
+                ON NOT d.is_frozen AND d.seed_image_id = i.image_id
             WHERE d.seed_image_id IS NOT NULL
+              AND COALESCE(d.winner_s3_path, i.s3_path) IS NOT NULL
             ORDER BY d.date DESC
         """)
 
         history = cursor.fetchall()
+
+        s3_paths = [item['s3_path'] for item in history]
+        urls = image_urls(s3_paths)
+        # optional thumbnail URLs for the history grid
+        size = _thumbnail_size(request.args.get('size'))
+        thumbnail_urls = image_urls(s3_paths, size) if size else {}
+        for item in history:
+            item['image_url'] = urls[item['s3_path']]
+            if size:
+                item['thumbnail_url'] = thumbnail_urls[item['s3_path']]
         return jsonify({'history': history}), 200
 
     except Exception as e:
@@ -667,5 +1412,68 @@ def get_history():
             db_conn.close()
 
 
+@bp.route('/metrics')
+def metrics():
+    """Prometheus text exposition of this worker's metrics."""
+    if not METRICS_ENABLED:
+        return 'Metrics are disabled', 404
+    return Response(registry.render(),
+                    mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+registry.register_collector(
+    'pixelspatchwork_db_pool', 'Database pool', db_pool.stats)
+registry.register_collector(
+    'pixelspatchwork_proxy_cache', 'Proxy image cache', proxy_cache.stats)
+registry.register_collector(
+    'pixelspatchwork_seed_png_cache', 'Seed PNG cache', seed_png_cache.stats)
+registry.register_collector(
+    'pixelspatchwork_derivative_lookups', 'Thumbnail existence cache',
+    derivative_lookups.stats)
+registry.register_collector(
+    'pixelspatchwork_generation_jobs', 'Generation jobs', generation_jobs.stats)
+registry.register_collector(
+    'pixelspatchwork_admission', 'Generation admission', admission.stats)
+registry.register_collector(
+    'pixelspatchwork_participants', 'Cached participants', participants.stats)
+registry.register_collector(
+    'pixelspatchwork_vote_buffer', 'Vote buffer', vote_buffer.stats)
+registry.register_collector(
+    'pixelspatchwork_vote_events', 'Vote streams', vote_events.stats)
+if presigned_urls is not None:
+    registry.register_collector(
+        'pixelspatchwork_presigned_urls', 'Presigned URL cache',
+        presigned_urls.stats)
+
+
+def create_app():
+    """
+    Build the Flask app. Configuration is validated once here rather
+    than per request; the DB pool, S3 client, caches and background
+    buffers are built once when this module is imported and shared by
+    every request in the worker.
+
+    Run under gunicorn with `gunicorn 'app:create_app()'`.
+    """
+    validate_env()
+    app = Flask(__name__)
+    CORS(app)
+    app.register_blueprint(bp)
+    return app
+
+
+_app = None
+
+
+def __getattr__(name):
+    # keeps `gunicorn app:app` and `from app import app` working
+    global _app
+    if name == 'app':
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
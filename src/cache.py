@@ -0,0 +1,182 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUByteCache:
+    """
+    Thread-safe LRU cache of byte payloads bounded by total size.
+    Values are (bytes, metadata) pairs; the least recently used entries
+    are evicted once the cached bytes exceed `max_bytes`.
+    """
+
+    def __init__(self, max_bytes, max_item_bytes=None):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes or max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return (data, metadata) for key, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def __contains__(self, key):
+        """Probe for key without counting a hit or miss or reordering."""
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key, data, metadata=None):
+        """Cache data under key; oversized payloads are not cached."""
+        size = len(data)
+        if size > self.max_item_bytes:
+            return False
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old[0])
+            self._entries[key] = (data, metadata or {})
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+        return True
+
+    def invalidate(self, key=None):
+        """Drop one key, or everything when key is None."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._size = 0
+            else:
+                old = self._entries.pop(key, None)
+                if old is not None:
+                    self._size -= len(old[0])
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class TTLCache:
+    """
+    Thread-safe memoization of small values keyed by e.g. date, with a
+    per-entry time-to-live as a safety net for missed invalidations.
+    Concurrent misses on the same key run the loader only once.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self.hits += 1
+                return True, entry[0]
+            return False, None
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for key, calling loader() on a miss."""
+        found, value = self._lookup(key)
+        if found:
+            return value
+        with self._load_lock:
+            # another thread may have loaded it while we waited
+            found, value = self._lookup(key)
+            if found:
+                return value
+            with self._lock:
+                self.misses += 1
+            value = loader()
+            now = time.monotonic()
+            with self._lock:
+                # drop expired keys (e.g. earlier dates) as we go
+                for stale in [k for k, (_, expires) in self._entries.items()
+                              if expires <= now]:
+                    del self._entries[stale]
+                self._entries[key] = (value, now + self.ttl)
+            return value
+
+    def invalidate(self, key=None):
+        """Drop one key, or everything when key is None."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+class LRUTTLCache:
+    """
+    Thread-safe map of small values (e.g. lookup results, negative ones
+    included) that expire after `ttl` seconds. At most `max_entries` are
+    kept, least recently used first out.
+    """
+
+    def __init__(self, ttl, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # key -> (value, expires_at)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """Return the value for key, or default if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
@@ -1,20 +1,169 @@
 from dotenv import load_dotenv
 import os
+import tempfile
 
 # Load environment variables from .env file
 load_dotenv()
 
+
+def _env(name, default=None):
+    # keys left empty in .env (as in .env.example) count as unset
+    return os.getenv(name) or default
+
+
 # Access environment variables
-AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY_ID')
-AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+AWS_ACCESS_KEY_ID = _env('AWS_ACCESS_KEY_ID')
+AWS_SECRET_ACCESS_KEY = _env('AWS_SECRET_ACCESS_KEY')
+OPENAI_API_KEY = _env('OPENAI_API_KEY')
+# point the OpenAI client at a local stand-in (unset for the real API)
+OPENAI_BASE_URL = _env('OPENAI_BASE_URL')
+# 'b64_json' returns the generated image inline; 'url' downloads it
+# from OpenAI's CDN afterwards
+OPENAI_RESPONSE_FORMAT = _env('OPENAI_RESPONSE_FORMAT', 'b64_json')
+# timeouts (seconds) and retries for the generated-image download
+IMAGE_DOWNLOAD_CONNECT_TIMEOUT = float(_env('IMAGE_DOWNLOAD_CONNECT_TIMEOUT', 5))
+IMAGE_DOWNLOAD_READ_TIMEOUT = float(_env('IMAGE_DOWNLOAD_READ_TIMEOUT', 30))
+IMAGE_DOWNLOAD_MAX_RETRIES = int(_env('IMAGE_DOWNLOAD_MAX_RETRIES', 3))
 
 # RDS configuration
-RDS_HOST = os.getenv('RDS_HOST')
-RDS_PORT = int(os.getenv('RDS_PORT', 3306))  # Default to 3306 if not specified
-RDS_DATABASE = os.getenv('RDS_DATABASE')
-RDS_USERNAME = os.getenv('RDS_USERNAME')
-RDS_PASSWORD = os.getenv('RDS_PASSWORD')
+RDS_HOST = _env('RDS_HOST')
+RDS_PORT = int(_env('RDS_PORT', 3306))  # Default to 3306 if not specified
+RDS_DATABASE = _env('RDS_DATABASE')
+RDS_USERNAME = _env('RDS_USERNAME')
+RDS_PASSWORD = _env('RDS_PASSWORD')
+
+# Database connection pool
+DB_POOL_SIZE = int(_env('DB_POOL_SIZE', 5))
+# seconds to wait for a free connection before failing the request
+DB_POOL_TIMEOUT = float(_env('DB_POOL_TIMEOUT', 10))
+# seconds before a connection is closed and replaced
+DB_POOL_RECYCLE = int(_env('DB_POOL_RECYCLE', 3600))
+# idle seconds after which a connection is pinged before reuse
+DB_POOL_PING_INTERVAL = int(_env('DB_POOL_PING_INTERVAL', 30))
+# seconds between pool stats log lines (0 disables)
+DB_POOL_STATS_INTERVAL = int(_env('DB_POOL_STATS_INTERVAL', 300))
+
+# S3 client
+S3_BUCKET = _env('S3_BUCKET', 'pixelspatchwork')
+# 's3' for AWS (or an S3-compatible endpoint), 'local' for the filesystem
+STORAGE_BACKEND = _env('STORAGE_BACKEND', 's3')
+LOCAL_STORAGE_DIR = _env('LOCAL_STORAGE_DIR', 'local-storage')
+# e.g. http://localhost:5000 for moto_server; unset for AWS
+S3_ENDPOINT_URL = _env('S3_ENDPOINT_URL')
+S3_MAX_POOL_CONNECTIONS = int(_env('S3_MAX_POOL_CONNECTIONS', 20))
+S3_CONNECT_TIMEOUT = float(_env('S3_CONNECT_TIMEOUT', 5))
+S3_READ_TIMEOUT = float(_env('S3_READ_TIMEOUT', 30))
+S3_MAX_ATTEMPTS = int(_env('S3_MAX_ATTEMPTS', 3))
+
+# /proxy-image caching
+PROXY_CACHE_MAX_BYTES = int(_env('PROXY_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+PROXY_CACHE_MAX_ITEM_BYTES = int(_env('PROXY_CACHE_MAX_ITEM_BYTES', 4 * 1024 * 1024))
+# browser cache lifetime for immutable submission images (seconds)
+PROXY_CACHE_MAX_AGE = int(_env('PROXY_CACHE_MAX_AGE', 31536000))
+# chunk size used when streaming uncached objects to the client
+PROXY_STREAM_CHUNK_SIZE = int(_env('PROXY_STREAM_CHUNK_SIZE', 64 * 1024))
+
+# seconds a resolved seed image is trusted before re-querying
+SEED_CACHE_TTL = int(_env('SEED_CACHE_TTL', 3600))
+# preprocessed 512x512 seed PNGs kept for /generate-image
+SEED_PNG_CACHE_MAX_BYTES = int(_env('SEED_PNG_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+
+# Background generation jobs
+GENERATION_WORKERS = int(_env('GENERATION_WORKERS', 4))
+# jobs allowed to wait for a worker before submissions are rejected
+GENERATION_QUEUE_DEPTH = int(_env('GENERATION_QUEUE_DEPTH', 16))
+# seconds a finished job's result stays available for polling
+GENERATION_RESULT_TTL = int(_env('GENERATION_RESULT_TTL', 600))
+# Retry-After seconds sent when the queue or in-flight cap is full
+GENERATION_RETRY_AFTER = int(_env('GENERATION_RETRY_AFTER', 5))
+
+# Generation admission control, shared by all workers on the host
+# generations a creator may start back to back
+GENERATION_RATE_BURST = int(_env('GENERATION_RATE_BURST', 3))
+# generations per minute a creator's allowance refills by (0 disables)
+GENERATION_RATE_PER_MINUTE = float(_env('GENERATION_RATE_PER_MINUTE', 2))
+# generations running at once across all workers (0 disables)
+GENERATION_MAX_IN_FLIGHT = int(_env('GENERATION_MAX_IN_FLIGHT', 8))
+# seconds an in-flight slot is held at most, in case a worker dies; a
+# generation job unfinished after this long is reported as failed
+GENERATION_SLOT_TTL = int(_env('GENERATION_SLOT_TTL', 300))
+# SQLite file holding the limiter and generation job state, shared by
+# the workers; must be on a local disk
+ADMISSION_STATE_PATH = _env(
+    'ADMISSION_STATE_PATH',
+    os.path.join(tempfile.gettempdir(), 'pixelspatchwork-admission.sqlite3'))
+
+# Write-behind vote buffer
+# seconds between batched vote writes
+VOTE_FLUSH_INTERVAL = float(_env('VOTE_FLUSH_INTERVAL', 2))
+# flush early once this many images have pending votes
+VOTE_FLUSH_MAX_PENDING = int(_env('VOTE_FLUSH_MAX_PENDING', 500))
+# most vote transitions accepted in one /votes request
+VOTE_BATCH_MAX_SIZE = int(_env('VOTE_BATCH_MAX_SIZE', 100))
+
+# /votes/stream live updates; every open stream holds a worker thread
+# for up to VOTE_STREAM_MAX_DURATION, so streams need a threaded worker
+# (gunicorn --threads N) and fewer of them than N per worker. 0 disables
+# streaming and the vote page polls /votes/counts instead
+VOTE_STREAM_MAX_CLIENTS = int(_env('VOTE_STREAM_MAX_CLIENTS', 0))
+# seconds over which vote flushes are merged into one event
+VOTE_STREAM_COALESCE_INTERVAL = float(_env('VOTE_STREAM_COALESCE_INTERVAL', 1))
+# events kept per day for Last-Event-ID resume
+VOTE_STREAM_BUFFER_SIZE = int(_env('VOTE_STREAM_BUFFER_SIZE', 256))
+# seconds between keepalive comments
+VOTE_STREAM_KEEPALIVE = int(_env('VOTE_STREAM_KEEPALIVE', 15))
+# seconds before a stream is closed and the browser reconnects
+VOTE_STREAM_MAX_DURATION = int(_env('VOTE_STREAM_MAX_DURATION', 300))
+# seconds between vote page polls of /votes/counts when not streaming
+VOTE_POLL_INTERVAL = int(_env('VOTE_POLL_INTERVAL', 10))
+
+# Per-day leaderboards
+# seconds before a day's leaderboard is rebuilt from the database
+LEADERBOARD_TTL = int(_env('LEADERBOARD_TTL', 300))
+# number of days kept in memory
+LEADERBOARD_MAX_DAYS = int(_env('LEADERBOARD_MAX_DAYS', 3))
+# largest ranking /leaderboard returns
+LEADERBOARD_MAX_LIMIT = int(_env('LEADERBOARD_MAX_LIMIT', 100))
+
+# days whose known participants are kept in memory
+PARTICIPANT_CACHE_DAYS = int(_env('PARTICIPANT_CACHE_DAYS', 3))
+
+# Day finalization (python src/finalize.py)
+# timezone the pages date submissions and votes in; a day closes at
+# midnight here
+DAY_TIMEZONE = _env('DAY_TIMEZONE', 'America/New_York')
+# time in DAY_TIMEZONE that `finalize.py schedule` freezes the previous
+# day at
+FINALIZE_DAY_AT = _env('FINALIZE_DAY_AT', '00:10')
+# days written per transaction when backfilling
+FINALIZE_BATCH_DAYS = int(_env('FINALIZE_BATCH_DAYS', 100))
+
+# /get-images pagination
+GET_IMAGES_PAGE_SIZE = int(_env('GET_IMAGES_PAGE_SIZE', 24))
+GET_IMAGES_MAX_PAGE_SIZE = int(_env('GET_IMAGES_MAX_PAGE_SIZE', 100))
+
+# how pages load images: 'proxy' relays them through /proxy-image,
+# 'presigned' hands out short-lived S3 URLs (needs a CORS rule on the
+# bucket for the seed canvas)
+IMAGE_DELIVERY = _env('IMAGE_DELIVERY', 'proxy')
+# presigned URL lifetime, and how long before expiry a URL stops being reused
+PRESIGNED_URL_EXPIRES = int(_env('PRESIGNED_URL_EXPIRES', 3600))
+PRESIGNED_URL_REFRESH_MARGIN = int(_env('PRESIGNED_URL_REFRESH_MARGIN', 300))
+
+# thumbnail derivative sizes (px, longest side) made for each submission
+THUMBNAIL_SIZES = [int(size) for size in _env('THUMBNAIL_SIZES', '128,256').split(',')]
+# seconds /proxy-image remembers whether a thumbnail exists (or is still
+# missing, e.g. before a backfill) before asking S3 again
+THUMBNAIL_LOOKUP_TTL = int(_env('THUMBNAIL_LOOKUP_TTL', 300))
+
+# seconds before an uploaded submission with no Image row is treated as
+# orphaned by `python src/submissions.py sweep`
+ORPHAN_SWEEP_MIN_AGE = int(_env('ORPHAN_SWEEP_MIN_AGE', 3600))
+# longest accepted client idempotency key
+IDEMPOTENCY_KEY_MAX_LENGTH = int(_env('IDEMPOTENCY_KEY_MAX_LENGTH', 128))
+
+# serve Prometheus metrics at /metrics
+METRICS_ENABLED = _env('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
 
 # Validate required environment variables
 
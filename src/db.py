@@ -0,0 +1,239 @@
+import logging
+import threading
+import time
+from collections import deque
+
+import mysql.connector
+
+from config import (
+    RDS_HOST, RDS_PORT, RDS_DATABASE, RDS_USERNAME, RDS_PASSWORD,
+    DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PING_INTERVAL,
+    DB_POOL_STATS_INTERVAL)
+from metrics import query_operation, span
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection frees up within the pool timeout."""
+
+
+class TimedCursor:
+    """Cursor proxy that records each query as a metrics span."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, query, params=None, *args, **kwargs):
+        with span('db', query_operation(query)):
+            return self._cursor.execute(query, params, *args, **kwargs)
+
+    def executemany(self, query, seq_params, *args, **kwargs):
+        with span('db', query_operation(query)):
+            return self._cursor.executemany(query, seq_params, *args, **kwargs)
+
+
+class PooledConnection:
+    """
+    Wraps a MySQL connection checked out of a ConnectionPool.
+    Calling close() hands the connection back to the pool instead of
+    tearing down the TCP connection, so existing route code can keep its
+    get_db_connection() / close() pattern.
+    """
+
+    def __init__(self, pool, conn, created_at):
+        self._pool = pool
+        self._conn = conn
+        self._created_at = created_at
+        self._returned = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self._conn.cursor(*args, **kwargs))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if not self._returned:
+            self._returned = True
+            self._pool._release(self._conn, self._created_at)
+
+
+class ConnectionPool:
+    """
+    Thread-safe, bounded pool of MySQL connections.
+    - At most `size` connections are open; callers wait up to `timeout`
+      seconds for one to be returned before PoolTimeout is raised
+    - Connections idle longer than `ping_interval` are pinged (and
+      reconnected) before being handed out
+    - Connections older than `recycle` seconds are closed and replaced
+    """
+
+    def __init__(self, size, timeout, recycle, ping_interval,
+                 stats_interval=0, **connect_args):
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_interval = ping_interval
+        self.stats_interval = stats_interval
+        self._connect_args = connect_args
+
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        # (connection, created_at, last_used) tuples, most recently used last
+        self._idle = deque()
+        self._last_stats_log = time.monotonic()
+
+        self._stats = {
+            'checkouts': 0,
+            'timeouts': 0,
+            'created': 0,
+            'health_checks': 0,
+            'discarded': 0,
+            'in_use': 0,
+            'wait_total_ms': 0.0,
+            'wait_max_ms': 0.0,
+        }
+
+    def _connect(self):
+        conn = mysql.connector.connect(**self._connect_args)
+        with self._lock:
+            self._stats['created'] += 1
+        return conn
+
+    def _discard(self, conn):
+        with self._lock:
+            self._stats['discarded'] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _take_idle(self):
+        """Pop an idle connection and make sure it is still usable."""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                conn, created_at, last_used = self._idle.pop()
+
+            now = time.monotonic()
+            if self.recycle and now - created_at > self.recycle:
+                self._discard(conn)
+                continue
+
+            if now - last_used > self.ping_interval:
+                try:
+                    conn.ping(reconnect=True, attempts=1, delay=0)
+                    with self._lock:
+                        self._stats['health_checks'] += 1
+                except Exception as e:
+                    logging.warning(f"Dropping stale pooled connection: {e}")
+                    self._discard(conn)
+                    continue
+
+            return conn, created_at
+
+    def get_connection(self):
+        """Check out a connection, waiting up to the pool timeout."""
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats['timeouts'] += 1
+            logging.error(
+                f"Timed out after {self.timeout}s waiting for a database "
+                f"connection; pool stats: {self.stats()}")
+            raise PoolTimeout('Timed out waiting for a database connection')
+
+        waited_ms = (time.monotonic() - start) * 1000
+        try:
+            idle = self._take_idle()
+            if idle is None:
+                idle = (self._connect(), time.monotonic())
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._stats['checkouts'] += 1
+            self._stats['in_use'] += 1
+            self._stats['wait_total_ms'] += waited_ms
+            self._stats['wait_max_ms'] = max(
+                self._stats['wait_max_ms'], waited_ms)
+
+        self._maybe_log_stats()
+        conn, created_at = idle
+        return PooledConnection(self, conn, created_at)
+
+    def _release(self, conn, created_at):
+        try:
+            # end any transaction the route left open so the next user
+            # does not inherit uncommitted work or a stale snapshot
+            if conn.in_transaction:
+                conn.rollback()
+            with self._lock:
+                self._idle.append((conn, created_at, time.monotonic()))
+        except Exception as e:
+            logging.warning(f"Discarding broken pooled connection: {e}")
+            self._discard(conn)
+        finally:
+            with self._lock:
+                self._stats['in_use'] -= 1
+            self._slots.release()
+
+    def stats(self):
+        """Return a snapshot of pool counters."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['idle'] = len(self._idle)
+        stats['size'] = self.size
+        stats['wait_avg_ms'] = (
+            stats['wait_total_ms'] / stats['checkouts']
+            if stats['checkouts'] else 0.0)
+        return stats
+
+    def _maybe_log_stats(self):
+        if not self.stats_interval:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_stats_log < self.stats_interval:
+                return
+            self._last_stats_log = now
+        logging.info(f"Database pool stats: {self.stats()}")
+
+    def close_all(self):
+        """Close every idle connection (used on shutdown)."""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return
+                conn = self._idle.pop()[0]
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+db_pool = ConnectionPool(
+    size=DB_POOL_SIZE,
+    timeout=DB_POOL_TIMEOUT,
+    recycle=DB_POOL_RECYCLE,
+    ping_interval=DB_POOL_PING_INTERVAL,
+    stats_interval=DB_POOL_STATS_INTERVAL,
+    host=RDS_HOST,
+    port=RDS_PORT,
+    database=RDS_DATABASE,
+    user=RDS_USERNAME,
+    password=RDS_PASSWORD,
+)
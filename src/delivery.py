@@ -0,0 +1,74 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class PresignedUrls:
+    """
+    Short-lived presigned S3 GET URLs, so browsers fetch images straight
+    from S3 instead of through /proxy-image.
+    - A URL is valid for `expires_in` seconds and reused until
+      `refresh_margin` seconds before it expires, so repeat page views
+      get the same URL and the browser cache keeps working
+    - At most `max_entries` URLs are kept, least recently used first out
+    Signing is local (no request to S3), so a page of URLs is signed in
+    one pass under a single lock.
+    """
+
+    def __init__(self, client, bucket, expires_in, refresh_margin,
+                 max_entries=10000):
+        if refresh_margin >= expires_in:
+            raise ValueError('refresh_margin must be shorter than expires_in')
+        self._client = client
+        self.bucket = bucket
+        self.expires_in = expires_in
+        self.refresh_margin = refresh_margin
+        self.max_entries = max_entries
+        # key -> (url, reuse_until)
+        self._urls = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        return self.get_many([key])[key]
+
+    def get_many(self, keys):
+        """Return {key: url}, signing only keys without a usable URL."""
+        now = time.monotonic()
+        urls = {}
+        with self._lock:
+            for key in keys:
+                entry = self._urls.get(key)
+                if entry is not None and entry[1] > now:
+                    self._urls.move_to_end(key)
+                    urls[key] = entry[0]
+                    self.hits += 1
+                    continue
+                url = self._client.generate_presigned_url(
+                    'get_object',
+                    Params={'Bucket': self.bucket, 'Key': key},
+                    ExpiresIn=self.expires_in)
+                self._urls[key] = (url, now + self.expires_in - self.refresh_margin)
+                self._urls.move_to_end(key)
+                urls[key] = url
+                self.misses += 1
+            while len(self._urls) > self.max_entries:
+                self._urls.popitem(last=False)
+        return urls
+
+    def epoch(self):
+        """
+        Changes every `refresh_margin` seconds; mixed into ETags of
+        responses that embed URLs so a 304 never revives a URL with
+        less than `refresh_margin` seconds left.
+        """
+        return int(time.time() // self.refresh_margin)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._urls),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
@@ -0,0 +1,195 @@
+import itertools
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+
+
+class TooManySubscribers(Exception):
+    """Raised when a stream is opened while every slot is taken."""
+
+
+class VoteEvents:
+    """
+    In-process fan-out of vote count changes to /votes/stream viewers.
+    - publish() is called after each vote flush with the counts of the
+      images that changed, as read back from the database, so they
+      include other workers' votes; changes are coalesced per day and
+      sent as one event every `coalesce_interval` seconds
+    - The last `buffer_size` events per day are kept so a reconnecting
+      EventSource can resume from its Last-Event-ID; older ids (or ids
+      from another process) get a 'reset' event telling the page to
+      refetch
+    - A viewer whose queue fills up is sent a 'reset' and dropped
+    Events are only sent for flushes of this process, and every open
+    stream holds a server thread.
+    """
+
+    def __init__(self, coalesce_interval, buffer_size, max_subscribers,
+                 queue_size=100):
+        self.coalesce_interval = coalesce_interval
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        # ids are '<epoch>-<seq>' with seq counted per day; the epoch
+        # tells ids of this process apart from those before a restart
+        self._epoch = uuid.uuid4().hex[:8]
+        self._seqs = {}
+
+        # day -> {image_id: (upvotes, downvotes)} waiting to be sent
+        self._pending = {}
+        # day -> leader image_id waiting to be sent
+        self._pending_leaders = {}
+        # day -> last leader sent, so only changes are announced
+        self._leaders = {}
+        # day -> deque of (seq, event) for Last-Event-ID resume
+        self._history = {}
+        # day -> set of subscriber queues
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._stats = {'published': 0, 'sent': 0, 'dropped': 0}
+
+    def _ensure_started(self):
+        # started lazily so forking servers start it in each worker
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name='vote-events', daemon=True)
+            self._thread.start()
+
+    def publish(self, day, counts, leader=None):
+        """Queue {image_id: (upvotes, downvotes)} and the day's leader."""
+        with self._lock:
+            self._ensure_started()
+            self._pending.setdefault(day, {}).update(counts)
+            if leader is not None:
+                self._pending_leaders[day] = leader
+            self._stats['published'] += len(counts)
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            # let further flushes land in the same event
+            time.sleep(self.coalesce_interval)
+            self._wakeup.clear()
+            try:
+                self._dispatch()
+            except Exception as e:
+                logging.error(f"Error sending vote events: {e}")
+
+    def _dispatch(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            leaders, self._pending_leaders = self._pending_leaders, {}
+            for day in set(pending) | set(leaders):
+                data = {'day': day.isoformat(), 'counts': {
+                    image_id: list(image_counts)
+                    for image_id, image_counts in pending.get(day, {}).items()}}
+                leader = leaders.get(day)
+                if leader is not None and leader != self._leaders.get(day):
+                    self._leaders[day] = leader
+                    data['leader'] = leader
+                if not data['counts'] and 'leader' not in data:
+                    continue
+
+                seq = next(self._seqs.setdefault(day, itertools.count(1)))
+                event = self._format(f"{self._epoch}-{seq}", 'votes', data)
+                history = self._history.setdefault(
+                    day, deque(maxlen=self.buffer_size))
+                history.append((seq, event))
+                for subscriber in list(self._subscribers.get(day, ())):
+                    self._send(day, subscriber, event)
+
+    def _send(self, day, subscriber, event):
+        """Queue an event for one viewer (lock held)."""
+        try:
+            subscriber.put_nowait(event)
+            self._stats['sent'] += 1
+        except queue.Full:
+            # too slow: make it refetch and reconnect instead of buffering
+            self._subscribers[day].discard(subscriber)
+            self._stats['dropped'] += 1
+            while True:
+                try:
+                    subscriber.get_nowait()
+                except queue.Empty:
+                    break
+            subscriber.put_nowait(self._format(None, 'reset', {}))
+            subscriber.put_nowait(None)
+
+    @staticmethod
+    def _format(event_id, name, data):
+        lines = [f"id: {event_id}"] if event_id else []
+        lines += [f"event: {name}",
+                  f"data: {json.dumps(data, separators=(',', ':'))}"]
+        return '\n'.join(lines) + '\n\n'
+
+    def _missed(self, day, last_event_id):
+        """Events after last_event_id, or None if they can't be replayed."""
+        epoch, _, seq = (last_event_id or '').partition('-')
+        if epoch != self._epoch or not seq.isdigit():
+            return None
+        seq = int(seq)
+        history = self._history.get(day, ())
+        if history and history[0][0] > seq + 1:
+            return None
+        return [event for event_seq, event in history if event_seq > seq]
+
+    def subscribe(self, day, last_event_id=None):
+        """Register a viewer of day; returns its queue of formatted events."""
+        subscriber = queue.Queue(self.queue_size)
+        with self._lock:
+            if sum(map(len, self._subscribers.values())) >= self.max_subscribers:
+                raise TooManySubscribers('Too many open vote streams')
+            if last_event_id:
+                missed = self._missed(day, last_event_id)
+                if missed is None or len(missed) > self.queue_size:
+                    missed = [self._format(None, 'reset', {})]
+                for event in missed:
+                    subscriber.put_nowait(event)
+            self._subscribers.setdefault(day, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, day, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(day)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[day]
+
+    def stream(self, day, subscriber, keepalive, max_duration):
+        """
+        Yield the viewer's events as SSE text, with keepalive comments,
+        for at most max_duration seconds; EventSource then reconnects
+        with Last-Event-ID, which frees the worker thread in between.
+        """
+        deadline = time.monotonic() + max_duration
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    event = subscriber.get(timeout=min(keepalive, remaining))
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if event is None:
+                    return
+                yield event
+        finally:
+            self.unsubscribe(day, subscriber)
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self._stats,
+                subscribers=sum(map(len, self._subscribers.values())),
+                days=len(self._history))
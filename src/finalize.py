@@ -0,0 +1,163 @@
+"""
+Freeze the results of closed days.
+
+While a day is open its Day row is kept current by many small writes:
+vote totals, participant counts and the leading image. Once the day has
+closed, finalizing recomputes the winner, total votes and distinct
+participants from Image in one aggregate pass. It writes them to Day
+with the winner's s3_path and sets is_frozen. The seed and history
+read paths then use those values, and late vote flushes leave them
+alone.
+
+    python src/finalize.py finalize-day [--day YYYY-MM-DD] [--force]
+    python src/finalize.py schedule
+
+Without --day, every closed day that isn't frozen yet is finalized in
+bulk. That covers backfilling all history, and a missed run catches up
+on the next one. A day closes at midnight in DAY_TIMEZONE, the timezone
+the pages date days in, whatever the server's own timezone. Run it from
+cron shortly after that midnight (e.g. `CRON_TZ=America/New_York` and
+`10 0 * * * python src/finalize.py finalize-day`), or keep `schedule`
+running, which does the same daily at FINALIZE_DAY_AT in DAY_TIMEZONE.
+--force recomputes days that are already frozen.
+"""
+import argparse
+import logging
+import time
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from config import DAY_TIMEZONE, FINALIZE_BATCH_DAYS, FINALIZE_DAY_AT
+from db import db_pool
+
+# winner order matches DayLeaderboard: upvotes desc, downvotes asc,
+# created_at asc, image_id asc
+FINALIZE_QUERY = """
+    UPDATE Day d
+    JOIN (
+        SELECT day,
+               SUM(upvotes + downvotes) AS total_votes,
+               COUNT(DISTINCT creator_id) AS participants,
+               -- only the first id is kept, so group_concat_max_len
+               -- truncating the rest is harmless
+               SUBSTRING_INDEX(GROUP_CONCAT(
+                   image_id
+                   ORDER BY upvotes DESC, downvotes ASC, created_at ASC, image_id ASC
+               ), ',', 1) AS winner_id
+        FROM Image
+        WHERE day IN ({placeholders})
+        GROUP BY day
+    ) results ON results.day = d.date
+    JOIN Image winner ON winner.image_id = results.winner_id
+    SET d.seed_image_id = results.winner_id,
+        d.winner_s3_path = winner.s3_path,
+        d.total_votes = results.total_votes,
+        d.total_participants = results.participants,
+        d.is_current = FALSE,
+        d.is_frozen = TRUE,
+        d.finalized_at = NOW()
+    WHERE {frozen_filter}
+"""
+
+
+def _days_to_finalize(cursor, before, day=None, force=False):
+    """Closed days (before `before`) with images, oldest first."""
+    conditions = ["date < %s", "seed_image_id IS NOT NULL"]
+    params = [before]
+    if day is not None:
+        conditions.append("date = %s")
+        params.append(day)
+    if not force:
+        conditions.append("NOT is_frozen")
+    cursor.execute(
+        f"SELECT date FROM Day WHERE {' AND '.join(conditions)} ORDER BY date",
+        params)
+    return [row[0] for row in cursor.fetchall()]
+
+
+def finalize(day=None, force=False, today=None,
+             batch_size=FINALIZE_BATCH_DAYS):
+    """
+    Freeze one closed day, or every closed day not frozen yet (every
+    closed day with force), `batch_size` days per transaction. Returns
+    the number of days frozen.
+    """
+    today = today or datetime.now(ZoneInfo(DAY_TIMEZONE)).date()
+    if day is not None and day >= today:
+        raise ValueError(f"{day} has not closed yet")
+
+    frozen = 0
+    try:
+        db_conn = db_pool.get_connection()
+        cursor = db_conn.cursor()
+        days = _days_to_finalize(cursor, today, day, force)
+
+        for i in range(0, len(days), batch_size):
+            batch = days[i:i + batch_size]
+            start = time.monotonic()
+            query = FINALIZE_QUERY.format(
+                placeholders=', '.join(['%s'] * len(batch)),
+                frozen_filter='TRUE' if force else 'NOT d.is_frozen')
+            cursor.execute(query, batch)
+            # days frozen concurrently or whose winner row is gone are
+            # not updated
+            updated = cursor.rowcount
+            db_conn.commit()
+            frozen += updated
+            logging.info(
+                f"Finalized {batch[0]}..{batch[-1]} ({updated} of "
+                f"{len(batch)} days) in {(time.monotonic() - start) * 1000:.0f}ms")
+    finally:
+        if 'cursor' in locals():
+            cursor.close()
+        if 'db_conn' in locals():
+            db_conn.close()
+
+    logging.info(f"Finalize done: {frozen} days frozen")
+    return frozen
+
+
+def _seconds_until(at, tz=DAY_TIMEZONE):
+    """Seconds until the next HH:MM in timezone tz."""
+    hour, minute = map(int, at.split(':'))
+    now = datetime.now(ZoneInfo(tz))
+    next_run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    # timestamps, so a DST change in between is accounted for
+    return next_run.timestamp() - now.timestamp()
+
+
+def schedule(at=FINALIZE_DAY_AT):
+    """Finalize pending days now, then every day at `at`."""
+    while True:
+        try:
+            finalize()
+        except Exception as e:
+            logging.error(f"Error finalizing days: {e}")
+        time.sleep(_seconds_until(at))
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description='Freeze the winner and stats of closed days.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    finalize_parser = commands.add_parser(
+        'finalize-day', help='freeze closed days that are still open')
+    finalize_parser.add_argument(
+        '--day', type=date.fromisoformat, help='only this day (YYYY-MM-DD)')
+    finalize_parser.add_argument(
+        '--force', action='store_true', help='recompute frozen days too')
+    commands.add_parser(
+        'schedule', help=f'finalize pending days daily at {FINALIZE_DAY_AT}')
+    args = parser.parse_args()
+
+    if args.command == 'finalize-day':
+        finalize(args.day, args.force)
+    elif args.command == 'schedule':
+        schedule()
+
+
+if __name__ == '__main__':
+    main()
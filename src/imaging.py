@@ -0,0 +1,173 @@
+import base64
+import posixpath
+import re
+import sys
+from array import array
+from io import BytesIO
+
+from PIL import Image, features
+
+# DALL-E 2 edits are requested at this size
+DALLE_SIZE = (512, 512)
+
+# alpha 0 (erased by the user) stays transparent, everything else is kept
+_KEEP_ALPHA_LUT = [0] + [255] * 255
+
+# run-length masks: longest run one uint16 holds, and the largest canvas
+MASK_RLE_MAX_RUN = 0xFFFF
+MASK_RLE_MAX_SIDE = 4096
+
+
+def process_mask_for_dalle(mask, size=DALLE_SIZE):
+    """
+    Process a canvas mask into the format DALL-E 2 expects:
+    - Transparent (alpha=0) for areas to edit
+    - Solid black (alpha=255) for areas to preserve
+    `mask` is either a PNG data URL or a run-length mask (see
+    decode_mask_rle). Returns mask in RGBA format, resized to `size`
+    """
+    if isinstance(mask, dict):
+        return _merge_dalle_mask(decode_mask_rle(mask), size)
+
+    # Decode mask image from base64
+    header, encoded = mask.split(",", 1)
+    mask_image = Image.open(BytesIO(base64.b64decode(encoded)))
+    return build_dalle_mask(mask_image, size)
+
+
+def is_mask_rle(mask):
+    """
+    Whether mask is a well-formed run-length mask whose runs cover its
+    canvas; checked without building the image.
+    """
+    if not (isinstance(mask, dict)
+            and mask.get('format') == 'rle'
+            and all(type(mask.get(side)) is int
+                    and 0 < mask[side] <= MASK_RLE_MAX_SIDE
+                    for side in ('width', 'height'))
+            and isinstance(mask.get('runs'), str)):
+        return False
+    try:
+        _mask_runs(mask)
+    except ValueError:
+        return False
+    return True
+
+
+def _mask_runs(mask):
+    try:
+        runs = array('H', base64.b64decode(mask['runs'], validate=True))
+    except ValueError:
+        raise ValueError('Invalid mask runs')
+    if sys.byteorder == 'big':
+        runs.byteswap()
+    if sum(runs) != mask['width'] * mask['height']:
+        raise ValueError('Mask runs do not cover the canvas')
+    return runs
+
+
+def decode_mask_rle(mask):
+    """
+    Alpha band of a run-length mask as sent by generate.html:
+    {"format": "rle", "width": W, "height": H, "runs": base64 of
+    little-endian uint16 run lengths}. Runs alternate kept and erased
+    pixels in row-major order, starting with kept; runs longer than
+    MASK_RLE_MAX_RUN are split by a zero-length run of the other kind.
+    Returns an 'L' image, 255 where kept and 0 where erased.
+    """
+    runs = _mask_runs(mask)
+    fills = (b'\xff' * MASK_RLE_MAX_RUN, bytes(MASK_RLE_MAX_RUN))
+    data = b''.join([fills[i & 1][:run] for i, run in enumerate(runs)])
+    return Image.frombytes('L', (mask['width'], mask['height']), data)
+
+
+def encode_mask_rle(mask_image):
+    """Run-length mask of an RGBA/LA canvas image (alpha 0 = erased)."""
+    if mask_image.mode not in ('RGBA', 'LA'):
+        mask_image = mask_image.convert('RGBA')
+    data = mask_image.getchannel('A').tobytes()
+
+    lengths = []
+    position = 0
+    for erased in re.finditer(rb'\x00+', data):
+        lengths += [erased.start() - position, erased.end() - erased.start()]
+        position = erased.end()
+    lengths.append(len(data) - position)
+
+    runs = array('H')
+    for run in lengths:
+        while run > MASK_RLE_MAX_RUN:
+            runs.extend((MASK_RLE_MAX_RUN, 0))
+            run -= MASK_RLE_MAX_RUN
+        runs.append(run)
+
+    if sys.byteorder == 'big':
+        runs.byteswap()
+    return {'format': 'rle', 'width': mask_image.width,
+            'height': mask_image.height,
+            'runs': base64.b64encode(runs.tobytes()).decode('ascii')}
+
+
+def build_dalle_mask(mask_image, size=DALLE_SIZE):
+    """
+    Threshold the alpha band and resize it on its own, then merge it
+    under black RGB bands. Only the single alpha band is processed at
+    full resolution, and the output is byte-identical to thresholding
+    and resizing a full RGBA image.
+    """
+    if mask_image.mode not in ('RGBA', 'LA'):
+        mask_image = mask_image.convert('RGBA')
+
+    alpha = mask_image.getchannel('A').point(_KEEP_ALPHA_LUT)
+    return _merge_dalle_mask(alpha, size)
+
+
+def _merge_dalle_mask(alpha, size):
+    if size and alpha.size != tuple(size):
+        alpha = alpha.resize(size)
+
+    black = Image.new('L', alpha.size, 0)
+    return Image.merge('RGBA', (black, black, black, alpha))
+
+
+def prepare_seed_png(image_data, size=DALLE_SIZE):
+    """Decode a seed image and return it as an RGBA PNG of `size`."""
+    seed_image = Image.open(BytesIO(image_data)).convert("RGBA")
+    seed_image = seed_image.resize(size)
+    seed_bytes = BytesIO()
+    seed_image.save(seed_bytes, format='PNG')
+    return seed_bytes.getvalue()
+
+
+# grid thumbnails: WebP where Pillow supports it, JPEG otherwise
+DERIVATIVE_FORMAT, DERIVATIVE_EXTENSION, DERIVATIVE_CONTENT_TYPE = (
+    ('WEBP', 'webp', 'image/webp') if features.check('webp')
+    else ('JPEG', 'jpg', 'image/jpeg'))
+
+
+def derivative_key(s3_path, size):
+    """Key of the `size`px derivative stored next to an original image."""
+    stem, _ = posixpath.splitext(s3_path)
+    return f"{stem}_{size}.{DERIVATIVE_EXTENSION}"
+
+
+def is_derivative_key(s3_path):
+    return s3_path.endswith('.' + DERIVATIVE_EXTENSION)
+
+
+def make_derivatives(image_data, sizes, quality=80):
+    """Return {size: bytes} of downscaled copies, longest side = size."""
+    image = Image.open(BytesIO(image_data))
+    image.load()
+    if DERIVATIVE_FORMAT == 'JPEG' or image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGB' if DERIVATIVE_FORMAT == 'JPEG' else 'RGBA')
+
+    derivatives = {}
+    for size in sorted(sizes, reverse=True):
+        # downscale from the previous (larger) result to save work
+        image = image.copy()
+        image.thumbnail((size, size), Image.LANCZOS)
+        buffer = BytesIO()
+        image.save(buffer, format=DERIVATIVE_FORMAT, quality=quality)
+        derivatives[size] = buffer.getvalue()
+    return derivatives
@@ -0,0 +1,185 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from statefile import StateFile
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS jobs (
+        job_id TEXT PRIMARY KEY,
+        job_key TEXT,
+        status TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        result TEXT,
+        error TEXT)
+    """,
+    "CREATE INDEX IF NOT EXISTS jobs_job_key ON jobs (job_key)",
+)
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while every slot is taken."""
+
+
+class JobRunner:
+    """
+    Runs slow work (image generation) on a bounded thread pool and keeps
+    per-job status for polling in a SQLite file shared by every worker
+    on the host, so a status poll may reach any worker.
+    - At most `max_workers` jobs run at once in this process and at
+      most `max_queued` more wait; further submissions raise QueueFull
+    - Finished jobs are kept for `result_ttl` seconds
+    - Submissions with the `job_key` of a job that has not failed get
+      that job back instead of starting a duplicate, whichever worker
+      accepted it
+    - A job still unfinished after `max_runtime` seconds is reported as
+      failed, since the worker running it must have died
+    Results are stored as JSON.
+    """
+
+    def __init__(self, path, max_workers, max_queued, result_ttl,
+                 max_runtime, busy_timeout=1.0):
+        self.path = path
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self.max_runtime = max_runtime
+        self._state = StateFile(path, SCHEMA, busy_timeout)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='generation')
+        self._slots = threading.BoundedSemaphore(max_workers + max_queued)
+        # jobs of this process, for stats()
+        self._counts = {'queued': 0, 'running': 0, 'succeeded': 0,
+                        'failed': 0, 'rejected': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, status, change=1):
+        with self._lock:
+            self._counts[status] += change
+
+    def _job(self, row, now):
+        """A job row as a dict, or None if it has expired."""
+        if row is None:
+            return None
+        job = dict(row)
+        if job['finished_at'] is None and now - job['created_at'] > self.max_runtime:
+            job.update(status='failed', error='Job was interrupted')
+        elif job['finished_at'] is not None and now - job['finished_at'] > self.result_ttl:
+            return None
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def _find(self, conn, job_key, now):
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE job_key = ? ORDER BY created_at DESC LIMIT 1",
+            (job_key,)).fetchone()
+        job = self._job(row, now)
+        return job['job_id'] if job and job['status'] != 'failed' else None
+
+    def submit(self, fn, *args, job_key=None, **kwargs):
+        """
+        Queue fn(*args, **kwargs); returns (job_id, created), where
+        created is False if job_key matched an existing job.
+        """
+        now = time.time()
+        conn = self._state.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._prune(conn, now)
+            existing = (self._find(conn, job_key, now)
+                        if job_key is not None else None)
+            if existing:
+                conn.execute("COMMIT")
+                return existing, False
+            if not self._slots.acquire(blocking=False):
+                self._count('rejected')
+                raise QueueFull('Too many generation jobs in progress')
+
+            job_id = str(uuid.uuid4())
+            try:
+                conn.execute(
+                    "INSERT INTO jobs (job_id, job_key, status, created_at) "
+                    "VALUES (?, ?, 'queued', ?)",
+                    (job_id, job_key, now))
+                conn.execute("COMMIT")
+            except BaseException:
+                self._slots.release()
+                raise
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+        self._count('queued')
+        try:
+            self._executor.submit(self._run, job_id, fn, args, kwargs)
+        except RuntimeError:
+            # executor is shutting down
+            self._slots.release()
+            self._count('queued', -1)
+            conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+            raise
+        return job_id, True
+
+    def _run(self, job_id, fn, args, kwargs):
+        self._count('queued', -1)
+        self._count('running')
+        self._update(job_id, status='running', started_at=time.time())
+        try:
+            result = fn(*args, **kwargs)
+            status, fields = 'succeeded', {
+                'result': json.dumps(result, default=str)}
+        except Exception as e:
+            logging.error(f"Generation job {job_id} failed: {e}")
+            status, fields = 'failed', {'error': str(e)}
+        finally:
+            self._count('running', -1)
+            self._slots.release()
+        self._count(status)
+        self._update(job_id, status=status, finished_at=time.time(), **fields)
+
+    def _update(self, job_id, **fields):
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        try:
+            self._state.connection().execute(
+                f"UPDATE jobs SET {assignments} WHERE job_id = ?",
+                (*fields.values(), job_id))
+        except sqlite3.Error as e:
+            # the poll reports the job as interrupted after max_runtime
+            logging.error(f"Error updating generation job {job_id}: {e}")
+
+    def _prune(self, conn, now):
+        """Forget jobs past their result_ttl (transaction held)."""
+        conn.execute("""
+            DELETE FROM jobs
+            WHERE finished_at < ? OR (finished_at IS NULL AND created_at < ?)
+        """, (now - self.result_ttl, now - self.max_runtime - self.result_ttl))
+
+    def find(self, job_key):
+        """Id of the job submitted with job_key unless it failed, else None."""
+        if job_key is None:
+            return None
+        return self._find(self._state.connection(), job_key, time.time())
+
+    def get(self, job_id):
+        """Return the job's state, or None if unknown/expired."""
+        row = self._state.connection().execute(
+            "SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._job(row, time.time())
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+        counts['max_workers'] = self.max_workers
+        counts['max_queued'] = self.max_queued
+        return counts
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,238 @@
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import date, datetime
+from itertools import chain, islice
+
+
+class SortedList:
+    """
+    Minimal sorted container kept as a list of sorted chunks, so inserts
+    and removals cost a bisect over chunk maxima plus a bounded
+    in-chunk shift instead of moving the whole list.
+    """
+
+    CHUNK_SIZE = 512
+
+    def __init__(self, items=()):
+        items = sorted(items)
+        size = self.CHUNK_SIZE
+        self._chunks = [items[i:i + size] for i in range(0, len(items), size)]
+        self._maxes = [chunk[-1] for chunk in self._chunks]
+        self._len = len(items)
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return chain.from_iterable(self._chunks)
+
+    def add(self, item):
+        self._len += 1
+        if not self._chunks:
+            self._chunks.append([item])
+            self._maxes.append(item)
+            return
+
+        i = min(bisect_left(self._maxes, item), len(self._maxes) - 1)
+        chunk = self._chunks[i]
+        insort(chunk, item)
+        self._maxes[i] = chunk[-1]
+
+        if len(chunk) > 2 * self.CHUNK_SIZE:
+            half = self.CHUNK_SIZE
+            self._chunks[i:i + 1] = [chunk[:half], chunk[half:]]
+            self._maxes[i:i + 1] = [chunk[half - 1], chunk[-1]]
+
+    def remove(self, item):
+        i = bisect_left(self._maxes, item)
+        if i == len(self._maxes):
+            raise ValueError(f"{item!r} not in list")
+        chunk = self._chunks[i]
+        j = bisect_left(chunk, item)
+        if j == len(chunk) or chunk[j] != item:
+            raise ValueError(f"{item!r} not in list")
+
+        del chunk[j]
+        self._len -= 1
+        if chunk:
+            self._maxes[i] = chunk[-1]
+        else:
+            del self._chunks[i]
+            del self._maxes[i]
+
+    def first(self):
+        return self._chunks[0][0] if self._chunks else None
+
+
+def _as_date(day):
+    return date.fromisoformat(day) if isinstance(day, str) else day
+
+
+def _as_datetime(created_at):
+    if isinstance(created_at, str):
+        return datetime.strptime(created_at, "%Y-%m-%d %H:%M:%S")
+    return created_at or datetime.min
+
+
+class DayLeaderboard:
+    """
+    Ranking of one day's images by (upvotes desc, downvotes asc,
+    created_at asc), the same order the winner queries use. Built once
+    from the database, then updated with the counts each vote flush
+    writes.
+    """
+
+    def __init__(self, day, rows):
+        self.day = day
+        self.loaded_at = time.monotonic()
+        self._lock = threading.Lock()
+        # image_id -> [upvotes, downvotes, created_at, s3_path]
+        self._images = {}
+        for row in rows:
+            self._images[row['image_id']] = [
+                row['upvotes'], row['downvotes'],
+                _as_datetime(row['created_at']), row.get('s3_path')]
+        self._ranking = SortedList(
+            self._key(image_id) for image_id in self._images)
+
+    def _key(self, image_id):
+        upvotes, downvotes, created_at, _ = self._images[image_id]
+        return (-upvotes, downvotes, created_at, image_id)
+
+    def __contains__(self, image_id):
+        with self._lock:
+            return image_id in self._images
+
+    def __len__(self):
+        with self._lock:
+            return len(self._images)
+
+    def add_image(self, image_id, created_at, s3_path=None,
+                  upvotes=0, downvotes=0):
+        with self._lock:
+            if image_id in self._images:
+                return
+            self._images[image_id] = [
+                upvotes, downvotes, _as_datetime(created_at), s3_path]
+            self._ranking.add(self._key(image_id))
+
+    def update(self, image_id, upvotes, downvotes):
+        """Set an image's counts; returns False if the image is unknown."""
+        with self._lock:
+            entry = self._images.get(image_id)
+            if entry is None:
+                return False
+            self._ranking.remove(self._key(image_id))
+            entry[0] = upvotes
+            entry[1] = downvotes
+            self._ranking.add(self._key(image_id))
+            return True
+
+    def counts(self, image_id):
+        """Return (upvotes, downvotes) of an image, or None if unknown."""
+        with self._lock:
+            entry = self._images.get(image_id)
+            return (entry[0], entry[1]) if entry else None
+
+    def leader(self):
+        """Return the current winning image as a dict, or None."""
+        with self._lock:
+            first = self._ranking.first()
+            return self._row(first[-1]) if first else None
+
+    def top(self, k):
+        """Return the k highest ranked images, best first."""
+        with self._lock:
+            return [self._row(key[-1], rank)
+                    for rank, key in enumerate(islice(self._ranking, k), 1)]
+
+    def _row(self, image_id, rank=1):
+        upvotes, downvotes, created_at, s3_path = self._images[image_id]
+        return {
+            'rank': rank,
+            'image_id': image_id,
+            's3_path': s3_path,
+            'upvotes': upvotes,
+            'downvotes': downvotes,
+            'created_at': created_at,
+        }
+
+
+class Leaderboards:
+    """
+    Per-day DayLeaderboard registry.
+    A day's board is loaded from the database on first use and rebuilt
+    after `ttl` seconds, which also folds in votes written by other
+    worker processes. Only the `max_days` most recently used days are
+    kept.
+    """
+
+    def __init__(self, get_connection, ttl, max_days):
+        self._get_connection = get_connection
+        self.ttl = ttl
+        self.max_days = max_days
+        self._boards = {}
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def _cached(self, day):
+        with self._lock:
+            board = self._boards.get(day)
+            if board and time.monotonic() - board.loaded_at < self.ttl:
+                # keep most recently used days last for eviction
+                self._boards[day] = self._boards.pop(day)
+                return board
+        return None
+
+    def get(self, day):
+        """Return the leaderboard for day, loading it if needed."""
+        day = _as_date(day)
+        board = self._cached(day)
+        if board:
+            return board
+
+        with self._load_lock:
+            board = self._cached(day)
+            if board:
+                return board
+            start = time.monotonic()
+            board = DayLeaderboard(day, self._load_rows(day))
+            logging.info(
+                f"Built leaderboard for {day} with {len(board)} images in "
+                f"{(time.monotonic() - start) * 1000:.1f}ms")
+            with self._lock:
+                self._boards.pop(day, None)
+                self._boards[day] = board
+                while len(self._boards) > self.max_days:
+                    self._boards.pop(next(iter(self._boards)))
+            return board
+
+    def loaded(self, day):
+        """Return the day's board only if it is already in memory."""
+        with self._lock:
+            return self._boards.get(_as_date(day))
+
+    def invalidate(self, day=None):
+        with self._lock:
+            if day is None:
+                self._boards.clear()
+            else:
+                self._boards.pop(_as_date(day), None)
+
+    def _load_rows(self, day):
+        try:
+            db_conn = self._get_connection()
+            cursor = db_conn.cursor(dictionary=True)
+            cursor.execute("""
+                SELECT image_id, s3_path, upvotes, downvotes, created_at
+                FROM Image
+                WHERE day = %s
+            """, (day,))
+            return cursor.fetchall()
+        finally:
+            if 'cursor' in locals():
+                cursor.close()
+            if 'db_conn' in locals():
+                db_conn.close()
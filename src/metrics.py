@@ -0,0 +1,220 @@
+"""
+Minimal in-process Prometheus metrics (text exposition format 0.0.4).
+
+Counters, gauges and histograms keep their values per label set under
+one lock each, so recording is a dict lookup and a few additions.
+Values are per process; with several gunicorn workers each worker's
+/metrics reports only its own requests.
+"""
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+# seconds; covers sub-millisecond queries up to slow DALL-E calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines += self._render_samples(items)
+        return lines
+
+    def _render_samples(self, items):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in items]
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # per-bucket (non-cumulative) counts, sum, count
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_samples(self, items):
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket"
+                             f"{_format_labels(self.labelnames, key, le)} {cumulative}")
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket"
+                         f"{_format_labels(self.labelnames, key, inf)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    """Metrics plus collectors that report other components' stats."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._add(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(),
+                  buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, prefix, documentation, collect):
+        """
+        Export the numeric values of collect() (e.g. a component's
+        stats() dict) as gauges named <prefix>_<key> at scrape time.
+        """
+        self._collectors.append((prefix, documentation, collect))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        for prefix, documentation, collect in self._collectors:
+            try:
+                values = collect()
+            except Exception:
+                continue
+            for key, value in sorted(values.items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"{prefix}_{re.sub(r'[^a-zA-Z0-9_]', '_', key)}"
+                lines += [f"# HELP {name} {documentation}: {key}",
+                          f"# TYPE {name} gauge",
+                          f"{name} {_format_value(value)}"]
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram(
+    'pixelspatchwork_stage_seconds',
+    'Time spent in DB queries, S3 and OpenAI calls and image transforms',
+    ('kind', 'operation'))
+stage_errors = registry.counter(
+    'pixelspatchwork_stage_errors_total',
+    'DB queries, S3 and OpenAI calls and image transforms that raised',
+    ('kind', 'operation'))
+
+
+@contextmanager
+def span(kind, operation):
+    """Time a block as one kind/operation stage, counting failures."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        stage_errors.inc(kind=kind, operation=operation)
+        raise
+    finally:
+        stage_seconds.observe(time.perf_counter() - start,
+                              kind=kind, operation=operation)
+
+
+_SQL_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|JOIN)\s+`?(\w+)', re.IGNORECASE)
+
+
+@lru_cache(maxsize=256)
+def query_operation(query):
+    """Low-cardinality label for a SQL statement, e.g. 'SELECT Image'."""
+    words = query.split(None, 1)
+    verb = words[0].upper() if words else ''
+    table = _SQL_TABLE.search(query)
+    return f"{verb} {table.group(1)}" if table else verb
@@ -0,0 +1,350 @@
+"""
+Versioned schema migrations for the PixelPatchwork database.
+
+    python src/migrate.py status            # show applied / pending versions
+    python src/migrate.py upgrade [--to N]  # apply pending migrations
+    python src/migrate.py check             # EXPLAIN the hot queries
+
+Connection settings come from config.py (the RDS_* variables). Applied
+versions are recorded in the schema_migrations table. Every step is
+idempotent, so running it against the existing production schema only
+adds what is missing.
+
+`check` runs EXPLAIN on each query the app issues on a hot path (EXPLAIN
+doesn't execute the writes among them) and exits non-zero if any of
+them falls back to a full table scan. Run it against a database holding
+realistic data (see benchmarks/), because MySQL may choose a scan for
+tables with only a handful of rows.
+"""
+import argparse
+import logging
+import sys
+from datetime import date
+
+import mysql.connector
+
+from config import RDS_HOST, RDS_PORT, RDS_DATABASE, RDS_USERNAME, RDS_PASSWORD
+
+logging.basicConfig(level=logging.INFO)
+
+
+def _table(name, ddl):
+    def step(cursor):
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {name} ({ddl}) "
+                       "ENGINE=InnoDB DEFAULT CHARSET=utf8mb4")
+    step.description = f"table {name}"
+    return step
+
+
+def _index(table, name, columns, unique=False):
+    """
+    Create an index unless one already starts with the same columns.
+    `columns` are SQL fragments such as 'upvotes DESC'.
+    """
+    def step(cursor):
+        wanted = [column.split()[0] for column in columns]
+        cursor.execute("""
+            SELECT index_name, column_name
+            FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = %s
+            ORDER BY index_name, seq_in_index
+        """, (table,))
+        existing = {}
+        for index_name, column_name in cursor.fetchall():
+            existing.setdefault(index_name, []).append(column_name)
+        if any(cols[:len(wanted)] == wanted for cols in existing.values()):
+            logging.info(f"  {table}: index on {', '.join(wanted)} exists")
+            return
+        kind = 'UNIQUE INDEX' if unique else 'INDEX'
+        cursor.execute(
+            f"CREATE {kind} {name} ON {table} ({', '.join(columns)})")
+    step.description = f"index {name} on {table}({', '.join(columns)})"
+    return step
+
+
+def _column(table, name, ddl):
+    """Add a column unless it already exists."""
+    def step(cursor):
+        cursor.execute("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = DATABASE() AND table_name = %s
+              AND column_name = %s
+        """, (table, name))
+        if cursor.fetchall():
+            logging.info(f"  {table}: column {name} exists")
+            return
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}")
+    step.description = f"column {table}.{name}"
+    return step
+
+
+def _backfill_participants(cursor):
+    # old Day.total_participants counted goodbye-page visits, repeats
+    # included; recount from the distinct creators
+    cursor.execute("""
+        INSERT IGNORE INTO DayParticipant (day, user_id)
+        SELECT DISTINCT day, creator_id FROM Image WHERE creator_id IS NOT NULL
+    """)
+    cursor.execute("""
+        UPDATE Day d
+        SET total_participants = (
+            SELECT COUNT(*) FROM DayParticipant p WHERE p.day = d.date)
+    """)
+
+
+_backfill_participants.description = 'DayParticipant and Day.total_participants from Image'
+
+
+# (version, description, steps); append new versions, never edit old ones
+MIGRATIONS = [
+    (1, 'base tables', [
+        _table('User', """
+            user_id VARCHAR(36) NOT NULL PRIMARY KEY,
+            username VARCHAR(255) NOT NULL DEFAULT 'Unknown',
+            created_at DATETIME NOT NULL,
+            is_banned BOOLEAN NOT NULL DEFAULT FALSE
+        """),
+        _table('Day', """
+            date DATE NOT NULL PRIMARY KEY,
+            seed_image_id VARCHAR(36) NULL,
+            total_votes INT NOT NULL DEFAULT 0,
+            total_participants INT NOT NULL DEFAULT 0,
+            is_current BOOLEAN NOT NULL DEFAULT FALSE
+        """),
+        _table('Image', """
+            image_id VARCHAR(36) NOT NULL PRIMARY KEY,
+            s3_path VARCHAR(255) NOT NULL,
+            prompt_text TEXT,
+            created_at DATETIME NOT NULL,
+            creator_id VARCHAR(36),
+            day DATE NOT NULL,
+            upvotes INT NOT NULL DEFAULT 0,
+            downvotes INT NOT NULL DEFAULT 0,
+            flags INT NOT NULL DEFAULT 0,
+            FOREIGN KEY (creator_id) REFERENCES User (user_id),
+            FOREIGN KEY (day) REFERENCES Day (date)
+        """),
+    ]),
+    (2, 'indexes for hot queries', [
+        # winner per day (seed image, vote flush) and previous-day lookup
+        _index('Image', 'idx_image_day_ranking',
+               ['day', 'upvotes DESC', 'downvotes', 'created_at']),
+        # /get-images keyset pages, newest first (InnoDB appends the
+        # image_id primary key, completing the (created_at, image_id) cursor)
+        _index('Image', 'idx_image_day_created', ['day', 'created_at']),
+        # participant check by creator
+        _index('Image', 'idx_image_creator_day', ['creator_id', 'day']),
+        # Day lookups by date, for schemas created without the primary key
+        _index('Day', 'uq_day_date', ['date'], unique=True),
+        # /get-history: days that have a winner, newest first
+        _index('Day', 'idx_day_seed_date', ['seed_image_id', 'date']),
+    ]),
+    (3, 'distinct participants per day', [
+        _table('DayParticipant', """
+            day DATE NOT NULL,
+            user_id VARCHAR(36) NOT NULL,
+            PRIMARY KEY (day, user_id)
+        """),
+        _backfill_participants,
+    ]),
+    (4, 'frozen day results', [
+        # set by `python src/finalize.py` once a day is closed
+        _column('Day', 'is_frozen', 'BOOLEAN NOT NULL DEFAULT FALSE'),
+        _column('Day', 'winner_s3_path', 'VARCHAR(255) NULL'),
+        _column('Day', 'finalized_at', 'DATETIME NULL'),
+    ]),
+]
+
+
+# name -> (query, params); mirrors the statements the app runs per
+# request or vote flush. Keep it in step when a query changes.
+def _hot_queries(day, image_id, creator_id):
+    return {
+        'seed: previous day': ("""
+            SELECT d.date, d.is_frozen, d.winner_s3_path,
+                   i.s3_path AS leader_s3_path
+            FROM Day d
+            LEFT JOIN Image i ON i.image_id = d.seed_image_id
+            WHERE d.date < %s AND d.seed_image_id IS NOT NULL
+            ORDER BY d.date DESC
+            LIMIT 1
+        """, (day,)),
+        'leaderboard: day images': ("""
+            SELECT image_id, s3_path, upvotes, downvotes, created_at
+            FROM Image
+            WHERE day = %s
+        """, (day,)),
+        'get-images: etag': ("""
+            SELECT COUNT(*), MAX(created_at),
+                   BIT_XOR(CRC32(CONCAT(image_id, ':', upvotes, ':', downvotes)))
+            FROM Image
+            WHERE day = %s
+        """, (day,)),
+        'get-images: page': ("""
+            SELECT image_id, s3_path, prompt_text, upvotes, downvotes, created_at
+            FROM Image
+            WHERE day = %s AND (created_at < NOW() OR (created_at = NOW() AND image_id < %s))
+            ORDER BY created_at DESC, image_id DESC
+            LIMIT 25
+        """, (day, image_id)),
+        'submission: find': ("""
+            SELECT image_id, s3_path, day, created_at
+            FROM Image
+            WHERE image_id = %s
+        """, (image_id,)),
+        'submission: day upsert': ("""
+            INSERT INTO Day (date, seed_image_id, total_votes, total_participants, is_current)
+            VALUES (%s, NULL, 0, 0, TRUE)
+            ON DUPLICATE KEY UPDATE date = date
+        """, (day,)),
+        'submission: image insert': ("""
+            INSERT INTO Image (image_id, s3_path, prompt_text, created_at,
+                               creator_id, day, upvotes, downvotes, flags)
+            VALUES (%s, 'p', 'p', NOW(), %s, %s, 0, 0, 0)
+        """, (image_id, creator_id, day)),
+        'submission: first seed': ("""
+            UPDATE Day
+            SET seed_image_id = %s
+            WHERE date = %s AND seed_image_id IS NULL
+        """, (image_id, day)),
+        'participant: record': (
+            "INSERT IGNORE INTO DayParticipant (day, user_id) VALUES (%s, %s)",
+            (day, creator_id)),
+        'participant: count': ("""
+            UPDATE Day SET total_participants = total_participants + 1
+            WHERE date = %s AND NOT is_frozen
+        """, (day,)),
+        'participant: day member': (
+            "SELECT 1 FROM DayParticipant WHERE day = %s AND user_id = %s",
+            (day, creator_id)),
+        'vote flush/counts: image counts': ("""
+            SELECT image_id, day, upvotes, downvotes
+            FROM Image WHERE image_id IN (%s)
+        """, (image_id,)),
+        'vote flush: total votes': ("""
+            UPDATE Day SET total_votes = total_votes + %s
+            WHERE date = %s AND NOT is_frozen
+        """, (1, day)),
+        'vote flush: day winner': ("""
+            UPDATE Day
+            SET seed_image_id = (
+                SELECT image_id FROM Image
+                WHERE day = %s
+                ORDER BY upvotes DESC, downvotes ASC, created_at ASC, image_id ASC
+                LIMIT 1)
+            WHERE date = %s AND NOT is_frozen
+        """, (day, day)),
+        'vote flush/counts: day leader': (
+            "SELECT seed_image_id FROM Day WHERE date = %s", (day,)),
+        'history': ("""
+            SELECT d.date, COALESCE(d.winner_s3_path, i.s3_path) AS s3_path
+            FROM Day d
+            LEFT JOIN Image i
+                ON NOT d.is_frozen AND d.seed_image_id = i.image_id
+            WHERE d.seed_image_id IS NOT NULL
+              AND COALESCE(d.winner_s3_path, i.s3_path) IS NOT NULL
+            ORDER BY d.date DESC
+        """, ()),
+    }
+
+
+def connect():
+    return mysql.connector.connect(
+        host=RDS_HOST,
+        port=RDS_PORT,
+        database=RDS_DATABASE,
+        user=RDS_USERNAME,
+        password=RDS_PASSWORD
+    )
+
+
+def _applied_versions(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT NOT NULL PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def status(db_conn):
+    cursor = db_conn.cursor()
+    applied = _applied_versions(cursor)
+    for version, description, _ in MIGRATIONS:
+        state = 'applied' if version in applied else 'pending'
+        print(f"{version:>4}  {state:<8} {description}")
+    cursor.close()
+
+
+def upgrade(db_conn, target=None):
+    cursor = db_conn.cursor()
+    applied = _applied_versions(cursor)
+    for version, description, steps in MIGRATIONS:
+        if version in applied or (target is not None and version > target):
+            continue
+        logging.info(f"Applying migration {version}: {description}")
+        for step in steps:
+            logging.info(f"  {step.description}")
+            step(cursor)
+        cursor.execute(
+            "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+            (version, description))
+        db_conn.commit()
+    cursor.close()
+
+
+def check(db_conn):
+    """EXPLAIN each hot query; returns the names that do a full scan."""
+    cursor = db_conn.cursor(dictionary=True)
+    cursor.execute("SELECT day, image_id, creator_id FROM Image ORDER BY day DESC LIMIT 1")
+    sample = cursor.fetchone() or {}
+    queries = _hot_queries(
+        sample.get('day', date.today()),
+        sample.get('image_id', ''),
+        sample.get('creator_id', ''))
+
+    failures = []
+    for name, (query, params) in queries.items():
+        cursor.execute('EXPLAIN ' + query, params)
+        plan = cursor.fetchall()
+        # INSERT ... VALUES reads nothing but always reports type ALL
+        scans = [row['table'] for row in plan
+                 if row.get('type') == 'ALL' and row.get('select_type') != 'INSERT']
+        keys = ', '.join(f"{row['table']}:{row.get('key') or '-'}" for row in plan)
+        if scans:
+            failures.append(name)
+            print(f"FAIL  {name}: full scan of {', '.join(scans)} ({keys})")
+        else:
+            print(f"ok    {name} ({keys})")
+    cursor.close()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Create, upgrade and check the database schema.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('status', help='list applied and pending migrations')
+    upgrade_parser = commands.add_parser('upgrade', help='apply pending migrations')
+    upgrade_parser.add_argument('--to', type=int, help='stop after this version')
+    commands.add_parser('check', help='fail if a hot query does a full table scan')
+    args = parser.parse_args()
+
+    db_conn = connect()
+    try:
+        if args.command == 'status':
+            status(db_conn)
+        elif args.command == 'upgrade':
+            upgrade(db_conn, args.to)
+        elif args.command == 'check':
+            if check(db_conn):
+                sys.exit(1)
+    finally:
+        db_conn.close()
+
+
+if __name__ == '__main__':
+    main()
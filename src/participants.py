@@ -0,0 +1,81 @@
+import threading
+
+
+class Participants:
+    """
+    Distinct creators per day, kept in the DayParticipant table.
+    - record() adds a creator in the caller's transaction and bumps
+      Day.total_participants only the first time, so the count stays
+      exact without scanning Image
+    - has_participated() answers from an in-memory set of known
+      participants per day and falls back to a primary-key lookup on a
+      miss, since another worker may have recorded the creator
+    Participation is never revoked, so cached answers can't go stale,
+    and a restarted worker relearns them from the table. Only the
+    `max_days` most recently used days are kept in memory.
+    """
+
+    def __init__(self, get_connection, max_days):
+        self._get_connection = get_connection
+        self.max_days = max_days
+        # day -> set of user_ids, most recently used day last
+        self._days = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def record(cursor, day, user_id):
+        """
+        Add user_id to day's participants inside an open transaction
+        (the Day row must exist). Returns True if they are new.
+        """
+        if not user_id:
+            return False
+        cursor.execute(
+            "INSERT IGNORE INTO DayParticipant (day, user_id) VALUES (%s, %s)",
+            (day, user_id))
+        if cursor.rowcount != 1:
+            return False
+        cursor.execute("""
+            UPDATE Day SET total_participants = total_participants + 1
+            WHERE date = %s AND NOT is_frozen
+        """, (day,))
+        return True
+
+    def remember(self, day, user_id):
+        """Cache a participant once their transaction has committed."""
+        if not user_id:
+            return
+        day = str(day)
+        with self._lock:
+            users = self._days.pop(day, None) or set()
+            users.add(user_id)
+            self._days[day] = users
+            while len(self._days) > self.max_days:
+                self._days.pop(next(iter(self._days)))
+
+    def has_participated(self, day, user_id):
+        with self._lock:
+            if user_id in self._days.get(str(day), ()):
+                return True
+
+        try:
+            db_conn = self._get_connection()
+            cursor = db_conn.cursor()
+            cursor.execute(
+                "SELECT 1 FROM DayParticipant WHERE day = %s AND user_id = %s",
+                (day, user_id))
+            found = cursor.fetchone() is not None
+        finally:
+            if 'cursor' in locals():
+                cursor.close()
+            if 'db_conn' in locals():
+                db_conn.close()
+
+        if found:
+            self.remember(day, user_id)
+        return found
+
+    def stats(self):
+        with self._lock:
+            return {'days': len(self._days),
+                    'participants': sum(map(len, self._days.values()))}
@@ -0,0 +1,33 @@
+import sqlite3
+import threading
+
+
+class StateFile:
+    """
+    Connections to the SQLite file that the workers on a host share for
+    admission and generation job state.
+    - One connection per thread, since sqlite3 connections aren't
+      shared; each is in autocommit mode with WAL journaling, so callers
+      open their own BEGIN IMMEDIATE transactions
+    - `schema` statements (CREATE ... IF NOT EXISTS) run on each new
+      connection, so every user creates only its own tables
+    - Rows come back as sqlite3.Row
+    """
+
+    def __init__(self, path, schema, busy_timeout=1.0):
+        self.path = path
+        self.schema = schema
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in self.schema:
+                conn.execute(statement)
+            self._local.conn = conn
+        return conn
@@ -0,0 +1,246 @@
+import hashlib
+import logging
+import mimetypes
+import os
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+from config import (
+    AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, STORAGE_BACKEND,
+    LOCAL_STORAGE_DIR, S3_ENDPOINT_URL, S3_MAX_POOL_CONNECTIONS,
+    S3_CONNECT_TIMEOUT, S3_READ_TIMEOUT, S3_MAX_ATTEMPTS)
+from metrics import span
+
+
+class LocalClientError(Exception):
+    """Mimics botocore's ClientError so callers can inspect error codes."""
+
+    def __init__(self, code, message=''):
+        super().__init__(f"{code}: {message}")
+        self.response = {'Error': {'Code': code, 'Message': message}}
+
+
+class LocalBody:
+    """File-backed stand-in for botocore's StreamingBody."""
+
+    def __init__(self, path, start=0, length=None):
+        self._file = open(path, 'rb')
+        self._file.seek(start)
+        self._remaining = length
+
+    def read(self, amt=None):
+        if self._file.closed:
+            return b''
+        full_read = amt is None
+        if self._remaining is not None:
+            amt = self._remaining if amt is None else min(amt, self._remaining)
+        data = self._file.read() if amt is None else self._file.read(amt)
+        if self._remaining is not None:
+            self._remaining -= len(data)
+        if full_read:
+            self.close()
+        return data
+
+    def iter_chunks(self, chunk_size=1024):
+        try:
+            while True:
+                chunk = self.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        self._file.close()
+
+
+class LocalS3Client:
+    """
+    Filesystem stand-in for the boto3 S3 client, for offline development
+    and load tests. Objects are stored at <root>/<bucket>/<key>.
+    Only the calls the app makes are implemented.
+    """
+
+    class exceptions:
+        class NoSuchKey(LocalClientError):
+            def __init__(self, key):
+                super().__init__('NoSuchKey', key)
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def _path(self, bucket, key):
+        path = (self.root / bucket / key).resolve()
+        if self.root.resolve() not in path.parents:
+            raise ValueError(f"Invalid key: {key}")
+        return path
+
+    def _metadata(self, path):
+        stat = path.stat()
+        # objects are written once, so size + mtime identifies a version
+        etag = hashlib.md5(
+            f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()
+        return {
+            'ContentLength': stat.st_size,
+            'ContentType': mimetypes.guess_type(path.name)[0] or 'image/png',
+            'ETag': f'"{etag}"',
+            'LastModified': datetime.fromtimestamp(
+                stat.st_mtime, tz=timezone.utc),
+        }
+
+    def put_object(self, Bucket, Key, Body, ContentType=None,
+                   IfNoneMatch=None, **kwargs):
+        path = self._path(Bucket, Key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = Body if isinstance(Body, (bytes, bytearray)) else Body.read()
+        # unique per write, so concurrent writers of one key don't collide
+        tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        if IfNoneMatch == '*':
+            # link fails if the key exists, like S3's conditional write
+            try:
+                os.link(tmp_path, path)
+            except FileExistsError:
+                raise LocalClientError('PreconditionFailed', Key)
+            finally:
+                os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+        return {'ETag': self._metadata(path)['ETag']}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        path = self._path(Bucket, Key)
+        if not path.is_file():
+            raise self.exceptions.NoSuchKey(Key)
+        return self._metadata(path)
+
+    def list_objects_v2(self, Bucket, Prefix='', **kwargs):
+        bucket_root = self.root / Bucket
+        keys = sorted(
+            path.relative_to(bucket_root).as_posix()
+            for path in bucket_root.rglob('*')
+            if path.is_file() and not path.name.endswith('.tmp'))
+        contents = []
+        for key in keys:
+            if key.startswith(Prefix):
+                stat = (bucket_root / key).stat()
+                contents.append({
+                    'Key': key,
+                    'Size': stat.st_size,
+                    'LastModified': datetime.fromtimestamp(
+                        stat.st_mtime, tz=timezone.utc),
+                })
+        return {'Contents': contents, 'KeyCount': len(contents),
+                'IsTruncated': False}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        path = self._path(Bucket, Key)
+        if path.is_file():
+            path.unlink()
+        return {}
+
+    def get_object(self, Bucket, Key, Range=None, **kwargs):
+        response = self.head_object(Bucket, Key)
+        size = response['ContentLength']
+        start, length = 0, None
+        if Range:
+            start, end = _parse_byte_range(Range, size)
+            length = end - start + 1
+            response['ContentLength'] = length
+            response['ContentRange'] = f"bytes {start}-{end}/{size}"
+        response['Body'] = LocalBody(self._path(Bucket, Key), start, length)
+        return response
+
+
+def _parse_byte_range(header, size):
+    """Parse a single 'bytes=a-b' range into inclusive (start, end)."""
+    try:
+        first, last = header.split('=', 1)[1].split('-', 1)
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            start = max(size - int(last), 0)
+            end = size - 1
+    except (IndexError, ValueError):
+        raise LocalClientError('InvalidRange', header)
+    if start > end or start >= size:
+        raise LocalClientError('InvalidRange', header)
+    return start, end
+
+
+def iter_objects(client, bucket, prefix=''):
+    """Yield the listing entry of every object under prefix."""
+    kwargs = {'Bucket': bucket, 'Prefix': prefix}
+    while True:
+        response = client.list_objects_v2(**kwargs)
+        yield from response.get('Contents', [])
+        if not response.get('IsTruncated'):
+            return
+        kwargs['ContinuationToken'] = response['NextContinuationToken']
+
+
+def iter_keys(client, bucket, prefix=''):
+    """Yield every key under prefix, following list pagination."""
+    for obj in iter_objects(client, bucket, prefix):
+        yield obj['Key']
+
+
+class TimedClient:
+    """
+    S3 client proxy that records each API call as a metrics span.
+    Reading a returned streaming body is not included.
+    """
+
+    TIMED_CALLS = ('get_object', 'head_object', 'put_object',
+                   'delete_object', 'list_objects_v2',
+                   'generate_presigned_url')
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name not in self.TIMED_CALLS:
+            return attr
+
+        def call(*args, **kwargs):
+            with span('s3', name):
+                return attr(*args, **kwargs)
+        return call
+
+
+def create_s3_client():
+    """
+    Build the S3 client shared by every request in this worker.
+    boto3 clients are thread-safe, so one instance (and its HTTP
+    connection pool) is reused across threads.
+    """
+    if STORAGE_BACKEND == 'local':
+        logging.info(f"Using local filesystem storage at {LOCAL_STORAGE_DIR}")
+        return LocalS3Client(LOCAL_STORAGE_DIR)
+
+    # only needed for real S3; the local backend skips the import
+    import boto3
+    from botocore.config import Config
+
+    client_config = Config(
+        max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+        connect_timeout=S3_CONNECT_TIMEOUT,
+        read_timeout=S3_READ_TIMEOUT,
+        retries={'max_attempts': S3_MAX_ATTEMPTS, 'mode': 'standard'},
+    )
+    # S3_ENDPOINT_URL points the client at a local stand-in such as
+    # `moto_server` or MinIO
+    return boto3.client(
+        's3',
+        aws_access_key_id=AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+        endpoint_url=S3_ENDPOINT_URL,
+        config=client_config)
+
+
+s3_client = TimedClient(create_s3_client())
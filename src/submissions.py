@@ -0,0 +1,138 @@
+"""
+Idempotent submissions and cleanup of their S3 objects.
+
+A generated image is uploaded before its Image row is committed, so a
+crash or failed transaction in between leaves an object no row points
+to. The sweep deletes such orphans (and their thumbnails) once they are
+older than any generation could take:
+
+    python src/submissions.py sweep [--min-age SECONDS] [--dry-run]
+"""
+import argparse
+import logging
+import posixpath
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from config import S3_BUCKET, THUMBNAIL_SIZES, ORPHAN_SWEEP_MIN_AGE
+from db import db_pool
+from imaging import derivative_key
+from storage import iter_objects, s3_client
+
+bucket_name = S3_BUCKET
+SUBMISSION_PREFIX = 'daily-submissions/'
+# namespace for image ids derived from client idempotency keys
+SUBMISSION_NAMESPACE = uuid.UUID('488268fd-a3c8-489c-a5b2-827fbe46f8a1')
+
+
+def submission_image_id(creator_id, idempotency_key):
+    """
+    Image id for a client's idempotency key. Retries of one submission
+    map to the same id (and S3 key), so the Image primary key rejects
+    duplicates.
+    """
+    return str(uuid.uuid5(SUBMISSION_NAMESPACE, f"{creator_id}:{idempotency_key}"))
+
+
+def image_id_from_key(s3_path):
+    """Image id of an original ({id}.png) or derivative ({id}_256.webp)."""
+    stem, _ = posixpath.splitext(posixpath.basename(s3_path))
+    return stem.split('_', 1)[0]
+
+
+def upload_submission(s3_path, image_data):
+    """
+    Upload an original unless its key already exists. Returns False if
+    another attempt of the same submission uploaded it first; objects
+    are served as immutable, so they are never overwritten.
+    """
+    try:
+        s3_client.put_object(
+            Bucket=bucket_name,
+            Key=s3_path,
+            Body=image_data,
+            ContentType='image/png',
+            IfNoneMatch='*',
+        )
+    except Exception as e:
+        code = getattr(e, 'response', {}).get('Error', {}).get('Code')
+        # 409 is a concurrent conditional write of the same key
+        if code not in ('PreconditionFailed', 'ConditionalRequestConflict'):
+            raise
+        return False
+    return True
+
+
+def delete_submission_objects(s3_path, sizes=THUMBNAIL_SIZES):
+    """Delete an original image and its derivatives."""
+    for key in [s3_path] + [derivative_key(s3_path, size) for size in sizes]:
+        s3_client.delete_object(Bucket=bucket_name, Key=key)
+
+
+def _existing_image_ids(image_ids, batch_size=500):
+    existing = set()
+    try:
+        db_conn = db_pool.get_connection()
+        cursor = db_conn.cursor()
+        for i in range(0, len(image_ids), batch_size):
+            batch = image_ids[i:i + batch_size]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(
+                f"SELECT image_id FROM Image WHERE image_id IN ({placeholders})",
+                batch)
+            existing.update(row[0] for row in cursor.fetchall())
+    finally:
+        if 'cursor' in locals():
+            cursor.close()
+        if 'db_conn' in locals():
+            db_conn.close()
+    return existing
+
+
+def sweep(min_age=ORPHAN_SWEEP_MIN_AGE, dry_run=False):
+    """Delete submission objects older than min_age seconds with no Image row."""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=min_age)
+    # image_id -> keys of the original and its derivatives
+    candidates = {}
+    for obj in iter_objects(s3_client, bucket_name, SUBMISSION_PREFIX):
+        if obj['LastModified'] < cutoff:
+            candidates.setdefault(
+                image_id_from_key(obj['Key']), []).append(obj['Key'])
+
+    existing = _existing_image_ids(list(candidates))
+    deleted = 0
+    for image_id, keys in candidates.items():
+        if image_id in existing:
+            continue
+        for key in keys:
+            logging.info(f"{'Would delete' if dry_run else 'Deleting'} orphan {key}")
+            if not dry_run:
+                s3_client.delete_object(Bucket=bucket_name, Key=key)
+            deleted += 1
+    logging.info(
+        f"Sweep done: {len(candidates)} images checked, "
+        f"{len(candidates) - len(existing)} orphaned, {deleted} objects "
+        f"{'to delete' if dry_run else 'deleted'}")
+    return deleted
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description='Clean up S3 objects of unrecorded submissions.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    sweep_parser = commands.add_parser(
+        'sweep', help='delete submission objects with no Image row')
+    sweep_parser.add_argument(
+        '--min-age', type=int, default=ORPHAN_SWEEP_MIN_AGE,
+        help='only consider objects older than this many seconds')
+    sweep_parser.add_argument(
+        '--dry-run', action='store_true', help='list orphans without deleting')
+    args = parser.parse_args()
+
+    if args.command == 'sweep':
+        sweep(args.min_age, args.dry_run)
+
+
+if __name__ == '__main__':
+    main()
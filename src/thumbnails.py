@@ -0,0 +1,83 @@
+"""
+Smaller derivatives of submitted images for the history and voting grids.
+
+Each original at daily-submissions/{day}/{image_id}.png gets copies such
+as {image_id}_128.webp and {image_id}_256.webp next to it. New uploads
+get them from generate_image(); existing objects can be backfilled:
+
+    python src/thumbnails.py backfill [--prefix daily-submissions/] [--force]
+"""
+import argparse
+import logging
+
+from config import S3_BUCKET, THUMBNAIL_SIZES
+from imaging import (
+    DERIVATIVE_CONTENT_TYPE, derivative_key, is_derivative_key,
+    make_derivatives)
+from metrics import span
+from storage import iter_keys, s3_client
+
+bucket_name = S3_BUCKET
+
+
+def upload_derivatives(s3_path, image_data, sizes=THUMBNAIL_SIZES):
+    """Create and upload every derivative of one original image."""
+    with span('image', 'derivatives'):
+        derivatives = make_derivatives(image_data, sizes)
+    for size, data in derivatives.items():
+        s3_client.put_object(
+            Bucket=bucket_name,
+            Key=derivative_key(s3_path, size),
+            Body=data,
+            ContentType=DERIVATIVE_CONTENT_TYPE,
+        )
+
+
+def backfill(prefix='daily-submissions/', sizes=THUMBNAIL_SIZES, force=False):
+    """Create missing derivatives for every original under prefix."""
+    keys = set(iter_keys(s3_client, bucket_name, prefix))
+    created = skipped = failed = 0
+    for s3_path in sorted(keys):
+        if is_derivative_key(s3_path):
+            continue
+        missing = [size for size in sizes
+                   if force or derivative_key(s3_path, size) not in keys]
+        if not missing:
+            skipped += 1
+            continue
+        try:
+            response = s3_client.get_object(Bucket=bucket_name, Key=s3_path)
+            upload_derivatives(s3_path, response['Body'].read(), missing)
+            created += 1
+            logging.info(f"Created derivatives {missing} for {s3_path}")
+        except Exception as e:
+            failed += 1
+            logging.error(f"Error creating derivatives for {s3_path}: {e}")
+    logging.info(
+        f"Backfill done: {created} images processed, {skipped} up to date, "
+        f"{failed} failed")
+    return created, skipped, failed
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description='Manage thumbnail derivatives of submitted images.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    backfill_parser = commands.add_parser(
+        'backfill', help='create missing derivatives for existing images')
+    backfill_parser.add_argument('--prefix', default='daily-submissions/')
+    backfill_parser.add_argument(
+        '--sizes', type=int, nargs='+', default=THUMBNAIL_SIZES)
+    backfill_parser.add_argument(
+        '--force', action='store_true', help='regenerate existing derivatives')
+    args = parser.parse_args()
+
+    if args.command == 'backfill':
+        _, _, failed = backfill(args.prefix, args.sizes, args.force)
+        if failed:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
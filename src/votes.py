@@ -0,0 +1,229 @@
+import atexit
+import logging
+import threading
+import time
+
+
+def vote_deltas(current_vote, new_vote):
+    """Return the (upvote, downvote) change for a vote transition."""
+    upvote_change = (new_vote == 1) - (current_vote == 1)
+    downvote_change = (new_vote == -1) - (current_vote == -1)
+    return upvote_change, downvote_change
+
+
+class VoteBuffer:
+    """
+    Write-behind buffer for image votes.
+    Votes are merged into per-image (upvote, downvote) deltas in memory
+    and written in one transaction every `flush_interval` seconds, or as
+    soon as `max_pending` images have pending deltas. Each flush also
+    writes any buffered Day.total_votes changes and resolves the Day
+    winner once per affected day from Image. The counts it wrote are
+    read back for live events and copied into the in-memory day
+    leaderboards, which only serve reads. Pending votes are flushed at
+    interpreter exit; a failed flush keeps its deltas for the next
+    attempt.
+    """
+
+    def __init__(self, get_connection, leaderboards, flush_interval,
+                 max_pending, on_flush=None):
+        self._get_connection = get_connection
+        self._leaderboards = leaderboards
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # called after a successful flush with {day: (counts, leader_id)},
+        # counts being {image_id: (upvotes, downvotes)} of the images
+        # whose votes were written
+        self._on_flush = on_flush
+
+        self._pending = {}
+        # date -> pending Day.total_votes change
+        self._pending_totals = {}
+        self._lock = threading.Lock()
+        # serializes flushes so deltas are applied in order
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = None
+
+        self._stats = {'votes': 0, 'flushes': 0, 'rows_written': 0,
+                       'failures': 0}
+
+    def _ensure_started(self):
+        # started lazily so forking servers start it in each worker
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name='vote-flusher', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def add(self, image_id, upvote_change, downvote_change):
+        """Record a vote delta for later writing."""
+        self.add_many({image_id: (upvote_change, downvote_change)})
+
+    def add_many(self, deltas, day=None, total_votes=0):
+        """
+        Record {image_id: (upvote_change, downvote_change)} and a change
+        to day's total_votes together, so the same flush writes them.
+        """
+        deltas = {image_id: delta for image_id, delta in deltas.items()
+                  if delta != (0, 0)}
+        if not deltas and not total_votes:
+            return
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Vote buffer is closed')
+            self._ensure_started()
+            for image_id, (upvote_change, downvote_change) in deltas.items():
+                up, down = self._pending.get(image_id, (0, 0))
+                self._pending[image_id] = (up + upvote_change,
+                                           down + downvote_change)
+            if total_votes:
+                self._pending_totals[day] = (
+                    self._pending_totals.get(day, 0) + total_votes)
+            self._stats['votes'] += len(deltas)
+            if len(self._pending) >= self.max_pending:
+                self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, pending=len(self._pending),
+                        pending_totals=len(self._pending_totals))
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Error flushing votes: {e}")
+
+    def flush(self):
+        """Write all pending deltas in one transaction."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                totals, self._pending_totals = self._pending_totals, {}
+            batch = {image_id: delta for image_id, delta in batch.items()
+                     if delta != (0, 0)}
+            totals = {day: total for day, total in totals.items() if total}
+            if not batch and not totals:
+                return
+
+            start = time.monotonic()
+            try:
+                changes = self._write(batch, totals)
+            except Exception:
+                self._requeue(batch, totals)
+                with self._lock:
+                    self._stats['failures'] += 1
+                raise
+
+            with self._lock:
+                self._stats['flushes'] += 1
+                self._stats['rows_written'] += len(batch)
+            logging.info(
+                f"Flushed votes for {len(batch)} images across "
+                f"{len(changes)} days in {(time.monotonic() - start) * 1000:.1f}ms")
+            if self._on_flush and changes:
+                self._on_flush(changes)
+
+    def _requeue(self, batch, totals):
+        with self._lock:
+            for image_id, (up, down) in batch.items():
+                pending_up, pending_down = self._pending.get(image_id, (0, 0))
+                self._pending[image_id] = (pending_up + up,
+                                           pending_down + down)
+            for day, total in totals.items():
+                self._pending_totals[day] = (
+                    self._pending_totals.get(day, 0) + total)
+
+    def _write(self, batch, totals):
+        try:
+            db_conn = self._get_connection()
+            cursor = db_conn.cursor()
+
+            # Update votes for the images
+            counts = {}
+            if batch:
+                cursor.executemany(
+                    "UPDATE Image SET upvotes = GREATEST(0, upvotes + %s), downvotes = GREATEST(0, downvotes + %s) WHERE image_id = %s",
+                    [(up, down, image_id)
+                     for image_id, (up, down) in batch.items()]
+                )
+                # read the counts back, since other workers' votes make
+                # this worker's boards stale; events then never overwrite
+                # fresher counts with older ones
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor.execute(f"""
+                    SELECT image_id, day, upvotes, downvotes
+                    FROM Image WHERE image_id IN ({placeholders})
+                """, list(batch))
+                for image_id, day, upvotes, downvotes in cursor.fetchall():
+                    counts.setdefault(day, {})[image_id] = (upvotes, downvotes)
+
+            # Update total_votes for each day
+            for day, total in totals.items():
+                cursor.execute("""
+                    UPDATE Day SET total_votes = total_votes + %s
+                    WHERE date = %s AND NOT is_frozen
+                """, (total, day))
+
+            leaders = {}
+            for day in counts:
+                # Update the Day table with the highest voted image. The
+                # winner comes from Image (idx_image_day_ranking), not
+                # the board, which may be missing other workers' votes
+                # and images; frozen days keep the winner finalize.py
+                # recorded
+                cursor.execute("""
+                    UPDATE Day
+                    SET seed_image_id = (
+                        SELECT image_id FROM Image
+                        WHERE day = %s
+                        ORDER BY upvotes DESC, downvotes ASC, created_at ASC, image_id ASC
+                        LIMIT 1)
+                    WHERE date = %s AND NOT is_frozen
+                """, (day, day))
+                cursor.execute(
+                    "SELECT seed_image_id FROM Day WHERE date = %s", (day,))
+                row = cursor.fetchone()
+                if row and row[0]:
+                    leaders[day] = row[0]
+
+            db_conn.commit()
+        finally:
+            if 'cursor' in locals():
+                cursor.close()
+            if 'db_conn' in locals():
+                db_conn.close()
+
+        # refresh boards already in memory; others load fresh on use
+        for day, day_counts in counts.items():
+            board = self._leaderboards.loaded(day)
+            if board is not None:
+                for image_id, (upvotes, downvotes) in day_counts.items():
+                    board.update(image_id, upvotes, downvotes)
+        return {day: (day_counts, leaders.get(day))
+                for day, day_counts in counts.items()}
+
+    def close(self):
+        """Stop the flusher and write whatever is still pending."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+        try:
+            self.flush()
+        except Exception as e:
+            logging.error(
+                f"Error flushing votes on shutdown, {self.pending()} "
+                f"images not written: {e}")